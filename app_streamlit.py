@@ -1,427 +1,206 @@
 import streamlit as st
 import pandas as pd
-import xml.etree.ElementTree as ET
-import tempfile, os, io
+import os, time
+from auditor.auditoria import preparar, conciliar, conciliar_itens, completar_xml
+from auditor.conciliacao import TOLERANCIA
+from auditor.cache import CacheXML
+from auditor.indice import IndiceXML
+from contextlib import ExitStack, nullcontext
+from auditor.exportar import exportar, escrever_csv, FORMATOS
+from auditor.metricas import Metricas, etapa
+from auditor.tarefas import Tarefas, impressao_digital
+import json
 
-# ---------- Helpers ----------
-def detectar_encoding(path):
-    try:
-        import chardet
-    except ImportError:
-        return 'latin-1'
-    try:
-        with open(path, 'rb') as f:
-            raw = f.read(10000)
-        enc = chardet.detect(raw).get('encoding') or 'latin-1'
-        return enc
-    except Exception:
-        return 'latin-1'
+# ---------- UI ----------
+st.set_page_config(page_title="Auditor SPED (Web)", layout="wide")
+st.title("Auditor SPED – NF-e e CT-e (Web)")
+workers = st.sidebar.number_input("Processos para leitura (SPEDs e XMLs)", min_value=1, max_value=64, value=os.cpu_count() or 1, step=1)
+usar_cache = st.sidebar.checkbox("Reaproveitar XMLs já lidos (cache em disco)", value=True)
+if st.sidebar.button("Limpar cache de XMLs", help="O cache é um só no servidor: limpa para todos os usuários."):
+    with CacheXML() as c: c.limpar()
+    st.sidebar.success("Cache de XMLs limpo.")
+usar_indice = st.sidebar.checkbox("Guardar XMLs num índice permanente (entre competências)", value=True,
+                                  help="Notas sem XML no lote atual são procuradas nos XMLs enviados em auditorias anteriores, "
+                                       "por qualquer usuário deste servidor (o índice é um só, em disco).")
+if st.sidebar.button("Limpar índice de XMLs", help="Apaga o índice do servidor inteiro, para todos os usuários, não só desta sessão."):
+    with IndiceXML() as i: i.limpar()
+    st.sidebar.success("Índice de XMLs limpo.")
+st.sidebar.markdown("**Critérios da auditoria**")
+tolerancia = st.sidebar.number_input("Tolerância de diferença (R$)", min_value=0.0, value=TOLERANCIA, step=0.01, format="%.2f")
+so_entradas_nfe = st.sidebar.checkbox("NF-e: só notas com CFOP de entrada", value=True)
+itens_nfe = st.sidebar.checkbox("NF-e: conciliar também item a item (C170 x det)", value=False,
+                                help="Lê os itens dos SPEDs e dos XMLs para apontar em que item está a divergência (leitura mais lenta).")
+so_entradas_cte = st.sidebar.checkbox("CT-e: só CT-e com CFOP de entrada", value=False)
+medir = st.sidebar.checkbox("Medir desempenho (métricas por etapa)", value=os.environ.get("AUDITOR_METRICAS") == "1",
+                            help="Tempo, vazão e memória de cada etapa, num painel, numa aba \"Métricas\" do Excel e no log (JSON).")
+formato = st.sidebar.radio("Formato do arquivo", list(FORMATOS), format_func=lambda f: f"{FORMATOS[f][0]} (.{f})",
+                           help="Para resultados muito grandes, CSV ou Parquet são mais rápidos de gerar e baixar.")
 
-def extrair_competencia_do_0000(path, enc):
-    try:
-        with open(path, 'r', encoding=enc, errors='ignore') as f:
-            for _ in range(20):
-                line = f.readline()
-                if not line: break
-                if line.startswith('|0000|'):
-                    fields = line.strip().split('|')
-                    if len(fields) > 4 and len(fields[4]) == 8:
-                        dt_ini = fields[4]; return f"{dt_ini[2:4]}/{dt_ini[4:8]}"
-        return "Competência Não Encontrada"
-    except Exception as e:
-        return f"Erro ao extrair competência: {e}"
+# ---------- Download ----------
+def _arquivo(df, avisos, nome_aba, formato, metricas, itens=None):
+    # o arquivo só é gerado quando o botão é clicado (download adiado) e uma vez só por resultado/critério/formato
+    pronto = {}
+    def gerar():
+        if "dados" not in pronto:
+            with etapa(metricas, f"Exportação ({formato})", len(df)) as m:
+                pronto["dados"] = exportar(df, avisos, formato, nome_aba, metricas=metricas, itens=itens).getvalue()
+                m["bytes"] = len(pronto["dados"])
+            if metricas is not None: metricas.log(etapas=[f"Exportação ({formato})"])
+        return pronto["dados"]
+    return gerar
 
-# ---------- XML NF-e ----------
-def parse_xml_nfe(xml_path):
-    data = {}
-    try:
-        tree = ET.parse(xml_path); root = tree.getroot()
-        ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
-        inf = root.find('.//nfe:infNFe', ns)
-        if inf is not None:
-            nfe_id = inf.get('Id')
-            data['Chave'] = (nfe_id[3:] if (nfe_id and nfe_id.startswith('NFe')) else nfe_id)
-        tot = root.find('.//nfe:ICMSTot', ns)
-        if tot is not None:
-            v = lambda tag: tot.find(f"nfe:{tag}", ns)
-            data['Valor ICMS XML'] = float((v('vICMS').text if v('vICMS') is not None and v('vICMS').text else 0) or 0)
-            data['Valor IPI XML']  = float((v('vIPI').text  if v('vIPI')  is not None and v('vIPI').text  else 0) or 0)
-            data['Valor Produtos XML'] = float((v('vProd').text if v('vProd') is not None and v('vProd').text else 0) or 0)
-        emit = root.find('.//nfe:emit', ns)
-        if emit is not None:
-            data['Emitente XML'] = (emit.find('nfe:xNome', ns).text if emit.find('nfe:xNome', ns) is not None else 'N/A')
-            data['CNPJ Emitente XML'] = (emit.find('nfe:CNPJ', ns).text if emit.find('nfe:CNPJ', ns) is not None else 'N/A')
-        dest = root.find('.//nfe:dest', ns)
-        if dest is not None:
-            data['Destinatário XML'] = (dest.find('nfe:xNome', ns).text if dest.find('nfe:xNome', ns) is not None else 'N/A')
-            data['CNPJ Destinatário XML'] = (dest.find('nfe:CNPJ', ns).text if dest.find('nfe:CNPJ', ns) is not None else 'N/A')
-        return data if data else None
-    except Exception:
-        return None
+def _memo(nome, chave, criar):
+    memo = st.session_state.setdefault("arquivos", {})
+    if memo.get(nome, (None,))[0] != chave: memo[nome] = (chave, criar())
+    return memo[nome][1]
 
-# ---------- XML CT-e ----------
-def parse_xml_cte(xml_path):
-    d = {}
-    try:
-        tree = ET.parse(xml_path); root = tree.getroot()
-        ns = {'cte': 'http://www.portalfiscal.inf.br/cte'}
-        inf = root.find('.//cte:infCte', ns)
-        if inf is not None:
-            cte_id = inf.get('Id'); d['Chave'] = (cte_id[3:] if (cte_id and cte_id.startswith('CTe')) else cte_id)
-        vPrest = root.find('.//cte:vPrest', ns)
-        if vPrest is not None:
-            t = vPrest.find('cte:vTPrest', ns); d['Valor Total Prestação XML'] = float(t.text) if t is not None and t.text else 0.0
-        icms_outra = root.find('.//cte:ICMS/cte:ICMSOutraUF', ns)
-        if icms_outra is not None:
-            v = lambda tag: icms_outra.find(f'cte:{tag}', ns)
-            d['BC ICMS XML'] = float(v('vBCOutraUF').text) if v('vBCOutraUF') is not None and v('vBCOutraUF').text else 0.0
-            d['Valor ICMS XML'] = float(v('vICMSOutraUF').text) if v('vICMSOutraUF') is not None and v('vICMSOutraUF').text else 0.0
-            d['Alíquota ICMS XML'] = float(v('pICMSOutraUF').text) if v('pICMSOutraUF') is not None and v('pICMSOutraUF').text else 0.0
-            cst = icms_outra.find('cte:CST', ns); d['CST XML'] = cst.text if cst is not None else 'N/A'
-        else:
-            for kind in ['ICMS00','ICMS90','ICMS20','ICMS40','ICMS51','ICMS60','ICMS70','ICMSPart','ICMSST','ICMSCons','ICMSUFDest']:
-                node = root.find(f'.//cte:ICMS/cte:{kind}', ns)
-                if node is not None:
-                    v = lambda tag: node.find(f'cte:{tag}', ns)
-                    d['BC ICMS XML'] = float(v('vBC').text) if v('vBC') is not None and v('vBC').text else 0.0
-                    d['Valor ICMS XML'] = float(v('vICMS').text) if v('vICMS') is not None and v('vICMS').text else 0.0
-                    d['Alíquota ICMS XML'] = float(v('pICMS').text) if v('pICMS') is not None and v('pICMS').text else 0.0
-                    cst = node.find('cte:CST', ns); d['CST XML'] = cst.text if cst is not None else 'N/A'
-                    break
-        # Tomador (toma3 simples)
-        toma = root.find('.//cte:toma3/cte:toma', ns)
-        toma_v = toma.text if toma is not None else ''
-        tipo = "Não Identificado"; nome = "N/A"
-        if toma_v == '0':
-            rem = root.find('.//cte:rem', ns); x = rem.find('cte:xNome', ns) if rem is not None else None; nome = x.text if x is not None else 'N/A'; tipo="Remetente"
-        elif toma_v == '1':
-            ex = root.find('.//cte:exped', ns); x = ex.find('cte:xNome', ns) if ex is not None else None; nome = x.text if x is not None else 'N/A'; tipo="Expedidor"
-        elif toma_v == '2':
-            rc = root.find('.//cte:receb', ns); x = rc.find('cte:xNome', ns) if rc is not None else None; nome = x.text if x is not None else 'N/A'; tipo="Recebedor"
-        elif toma_v == '3':
-            de = root.find('.//cte:dest', ns); x = de.find('cte:xNome', ns) if de is not None else None; nome = x.text if x is not None else 'N/A'; tipo="Destinatário"
-        d['Tipo Tomador XML'] = tipo; d['Nome Tomador XML'] = nome
-        # Emit/Dest
-        emit = root.find('.//cte:emit', ns)
-        if emit is not None:
-            xn = emit.find('cte:xNome', ns); c = emit.find('cte:CNPJ', ns)
-            d['Emitente XML'] = xn.text if xn is not None else 'N/A'; d['CNPJ Emitente XML'] = c.text if c is not None else 'N/A'
-        dest = root.find('.//cte:dest', ns)
-        if dest is not None:
-            xn = dest.find('cte:xNome', ns); c = dest.find('cte:CNPJ', ns)
-            d['Destinatário XML'] = xn.text if xn is not None else 'N/A'; d['CNPJ Destinatário XML'] = c.text if c is not None else 'N/A'
-        return d if d else None
-    except Exception:
-        return None
+def baixar(df, avisos, nome_aba, base, chave, metricas=None, itens=None):
+    # arquivo gerado em fluxo (ver auditor.exportar); fora do Excel, itens e avisos saem em arquivos à parte
+    rotulo, mime = FORMATOS[formato]
+    if formato == 'parquet':
+        try: pd.io.parquet.get_engine("auto")
+        except ImportError as e: st.error(f"Exportação em {rotulo} indisponível: {e}"); return
+    gerar = _memo(base, (chave, formato), lambda: _arquivo(df, avisos, nome_aba, formato, metricas, itens))
+    st.download_button(f"⬇️ Baixar {rotulo} ({nome_aba})", data=gerar, file_name=f"{base}.{formato}", mime=mime, on_click="ignore")
+    if formato != 'xlsx' and itens is not None:
+        gerar = _memo(f"{base}_itens", (chave, formato), lambda: _arquivo(itens, [], "Itens", formato, None))
+        st.download_button(f"⬇️ Baixar itens ({nome_aba})", data=gerar, file_name=f"{base}_itens.{formato}", mime=mime, on_click="ignore")
+    if formato != 'xlsx' and avisos:
+        st.download_button(f"⬇️ Baixar avisos ({nome_aba})", data=lambda: escrever_csv(pd.DataFrame({"Avisos": avisos})).getvalue(),
+                           file_name=f"{base}_avisos.csv", mime="text/csv", on_click="ignore")
 
-# ---------- Processadores (mesma regra do seu script) ----------
-def processar_sped_nfe(sped_path, xml_map):
-    recs, warns = [], []
-    enc = detectar_encoding(sped_path)
-    comp = extrair_competencia_do_0000(sped_path, enc)
-    if comp == "Competência Não Encontrada": warns.append(f"Aviso: Competência não encontrada em {os.path.basename(sped_path)}."); comp = "Desconhecida"
-    current, cfops = None, set()
-    try:
-        with open(sped_path,'r',encoding=enc,errors='ignore') as f:
-            for line_num, line in enumerate(f,1):
-                fields = line.strip().split('|')
-                if len(fields)<2: continue
-                t = fields[1]
-                if t=="C100":
-                    if current is not None:
-                        current['CFOP']=", ".join(sorted(cfops)) if cfops else ""
-                        icms = float(current.get("Valor ICMS SPED","0").replace(",",".")) if current.get("Valor ICMS SPED") else 0.0
-                        ipi  = float(current.get("Valor IPI SPED","0").replace(",","."))  if current.get("Valor IPI SPED")  else 0.0
-                        has_entry = any(c.startswith(("1","2","3")) for c in cfops)
-                        if (icms>0 or ipi>0) and has_entry:
-                            chave = current.get("Chave")
-                            if chave and chave in xml_map:
-                                x = xml_map[chave]
-                                current.update({
-                                    "Valor ICMS XML": x.get("Valor ICMS XML",0.0),
-                                    "Valor IPI XML": x.get("Valor IPI XML",0.0),
-                                    "Valor Produtos XML": x.get("Valor Produtos XML",0.0),
-                                    "Emitente XML": x.get("Emitente XML","N/A"),
-                                    "CNPJ Emitente XML": x.get("CNPJ Emitente XML","N/A"),
-                                    "Destinatário XML": x.get("Destinatário XML","N/A"),
-                                    "CNPJ Destinatário XML": x.get("CNPJ Destinatário XML","N/A"),
-                                    "XML Encontrado":"Sim"
-                                })
-                                diff_icms = icms - current["Valor ICMS XML"]
-                                diff_ipi  = ipi  - current["Valor IPI XML"]
-                                current["Diferença ICMS (SPED - XML)"]=diff_icms
-                                current["Diferença IPI (SPED - XML)"]=diff_ipi
-                                icms_div=abs(diff_icms)>=0.01; ipi_div=abs(diff_ipi)>=0.01
-                                current["Status Auditoria"]="OK" if not icms_div and not ipi_div else \
-                                    "Divergência: " + ", ".join(
-                                        (["Crédito a Maior"] if diff_icms>0 and icms_div else []) +
-                                        (["Crédito a Menor"] if diff_icms<0 and icms_div else []) +
-                                        (["Divergência IPI (a Maior)"] if diff_ipi>0 and ipi_div else []) +
-                                        (["Divergência IPI (a Menor)"] if diff_ipi<0 and ipi_div else [])
-                                    ) or "Divergência Geral"
-                            else:
-                                current.update({
-                                    "Valor ICMS XML":0.0,"Valor IPI XML":0.0,"Valor Produtos XML":0.0,
-                                    "Emitente XML":"N/A","CNPJ Emitente XML":"N/A","Destinatário XML":"N/A","CNPJ Destinatário XML":"N/A",
-                                    "XML Encontrado":"Não","Diferença ICMS (SPED - XML)":icms,"Diferença IPI (SPED - XML)":ipi,"Status Auditoria":"XML Não Encontrado"
-                                })
-                            recs.append(current)
-                    try:
-                        current={
-                            "Competência": comp,
-                            "Série da nota": fields[7].strip(),
-                            "Número da nota": fields[8].strip(),
-                            "Chave": fields[9].strip(),
-                            "Data de emissão": fields[10].strip(),
-                            "Valor Total SPED": fields[12].replace(",",".").strip(),
-                            "BC ICMS SPED": fields[21].replace(",",".").strip(),
-                            "Valor ICMS SPED": fields[22].replace(",",".").strip(),
-                            "Valor IPI SPED": fields[25].replace(",",".").strip()
-                        }
-                    except IndexError:
-                        warns.append(f"Aviso: C100 malformado em {os.path.basename(sped_path)} linha {line_num}.")
-                        current=None
-                    cfops=set()
-                elif t=="C170" and current is not None and len(fields)>11:
-                    cf = fields[11].strip()
-                    if cf: cfops.add(cf)
-        if current is not None:
-            # repete fechamento (igual acima)
-            current['CFOP']=", ".join(sorted(cfops)) if cfops else ""
-            icms=float(current.get("Valor ICMS SPED","0").replace(",",".")) if current.get("Valor ICMS SPED") else 0.0
-            ipi=float(current.get("Valor IPI SPED","0").replace(",",".")) if current.get("Valor IPI SPED") else 0.0
-            has_entry = any(c.startswith(("1","2","3")) for c in cfops)
-            if (icms>0 or ipi>0) and has_entry:
-                chave=current.get("Chave")
-                # … (mesma lógica do bloco anterior)
-                if chave and chave in xml_map:
-                    x=xml_map[chave]
-                    current.update({
-                        "Valor ICMS XML": x.get("Valor ICMS XML",0.0),
-                        "Valor IPI XML": x.get("Valor IPI XML",0.0),
-                        "Valor Produtos XML": x.get("Valor Produtos XML",0.0),
-                        "Emitente XML": x.get("Emitente XML","N/A"),
-                        "CNPJ Emitente XML": x.get("CNPJ Emitente XML","N/A"),
-                        "Destinatário XML": x.get("Destinatário XML","N/A"),
-                        "CNPJ Destinatário XML": x.get("CNPJ Destinatário XML","N/A"),
-                        "XML Encontrado":"Sim"
-                    })
-                    diff_icms=icms-current["Valor ICMS XML"]; diff_ipi=ipi-current["Valor IPI XML"]
-                    current["Diferença ICMS (SPED - XML)"]=diff_icms; current["Diferença IPI (SPED - XML)"]=diff_ipi
-                    icms_div=abs(diff_icms)>=0.01; ipi_div=abs(diff_ipi)>=0.01
-                    current["Status Auditoria"]="OK" if not icms_div and not ipi_div else "Divergência: " + ", ".join(
-                        (["Crédito a Maior"] if diff_icms>0 and icms_div else [])+
-                        (["Crédito a Menor"] if diff_icms<0 and icms_div else [])+
-                        (["Divergência IPI (a Maior)"] if diff_ipi>0 and ipi_div else [])+
-                        (["Divergência IPI (a Menor)"] if diff_ipi<0 and ipi_div else [])
-                    ) or "Divergência Geral"
-                else:
-                    current.update({
-                        "Valor ICMS XML":0.0,"Valor IPI XML":0.0,"Valor Produtos XML":0.0,
-                        "Emitente XML":"N/A","CNPJ Emitente XML":"N/A","Destinatário XML":"N/A","CNPJ Destinatário XML":"N/A",
-                        "XML Encontrado":"Não","Diferença ICMS (SPED - XML)":icms,"Diferença IPI (SPED - XML)":ipi,"Status Auditoria":"XML Não Encontrado"
-                    })
-                recs.append(current)
-    except Exception as e:
-        warns.append(f"Erro inesperado em {os.path.basename(sped_path)}: {e}")
-    return recs, warns
+def painel_metricas(metricas, base):
+    # etapas e destaques num painel recolhido (as mesmas linhas vão para o log em JSON à medida que são medidas)
+    with st.expander("Métricas de desempenho", expanded=False):
+        tabela = metricas.dataframe()
+        st.dataframe(tabela[tabela["Tipo"] == "Etapa"].drop(columns="Tipo"), hide_index=True, use_container_width=True)
+        destaques = tabela[tabela["Tipo"] != "Etapa"]
+        if not destaques.empty:
+            st.caption("Arquivos que se destacam")
+            st.dataframe(destaques.drop(columns="Pico de memória (MB)"), hide_index=True, use_container_width=True)
+        st.download_button("⬇️ Métricas (JSON)", data=json.dumps(metricas.json(), ensure_ascii=False, indent=1),
+                           file_name=f"{base}_metricas.json", mime="application/json")
 
-def processar_sped_cte(sped_path, xml_map):
-    recs, warns = [], []
-    enc = detectar_encoding(sped_path)
-    comp = extrair_competencia_do_0000(sped_path, enc)
-    if comp == "Competência Não Encontrada": warns.append(f"Aviso: Competência não encontrada em {os.path.basename(sped_path)}."); comp="Desconhecida"
-    current, cfops, aliquotas = None, set(), set()
-    try:
-        with open(sped_path,'r',encoding=enc,errors='ignore') as f:
-            for line_num, line in enumerate(f,1):
-                fields = line.strip().split('|')
-                if len(fields)<2: continue
-                t=fields[1]
-                if t=="D100":
-                    if current is not None:
-                        current['CFOPs SPED']=", ".join(sorted(cfops)) if cfops else ""
-                        current['Alíquotas ICMS SPED']=", ".join(sorted(aliquotas)) if aliquotas else ""
-                        bc=float(current.get("BC ICMS SPED","0").replace(",",".")) if current.get("BC ICMS SPED") else 0.0
-                        icms=float(current.get("Valor ICMS SPED","0").replace(",",".")) if current.get("Valor ICMS SPED") else 0.0
-                        if icms>0:
-                            chave=current.get("Chave CT-e")
-                            if chave and chave in xml_map:
-                                x=xml_map[chave]
-                                current.update({
-                                    "Valor Total Prestação XML":x.get("Valor Total Prestação XML",0.0),
-                                    "BC ICMS XML":x.get("BC ICMS XML",0.0),
-                                    "Valor ICMS XML":x.get("Valor ICMS XML",0.0),
-                                    "Alíquota ICMS XML":x.get("Alíquota ICMS XML",0.0),
-                                    "CST XML":x.get("CST XML","N/A"),
-                                    "Tipo Tomador XML":x.get("Tipo Tomador XML","Não Identificado"),
-                                    "Nome Tomador XML":x.get("Nome Tomador XML","N/A"),
-                                    "Emitente XML":x.get("Emitente XML","N/A"),
-                                    "CNPJ Emitente XML":x.get("CNPJ Emitente XML","N/A"),
-                                    "Destinatário XML":x.get("Destinatário XML","N/A"),
-                                    "CNPJ Destinatário XML":x.get("CNPJ Destinatário XML","N/A"),
-                                    "XML Encontrado":"Sim"
-                                })
-                                diff_bc=bc-current["BC ICMS XML"]; diff_icms=icms-current["Valor ICMS XML"]
-                                current["Diferença BC ICMS (SPED - XML)"]=diff_bc; current["Diferença ICMS (SPED - XML)"]=diff_icms
-                                icms_div=abs(diff_icms)>=0.01; bc_div=abs(diff_bc)>=0.01
-                                current["Status Auditoria"]="OK" if not icms_div and not bc_div else "Divergência: " + ", ".join(
-                                    (["Crédito a Maior"] if diff_icms>0 and icms_div else [])+
-                                    (["Crédito a Menor"] if diff_icms<0 and icms_div else [])+
-                                    (["Divergência BC ICMS (a Maior)"] if diff_bc>0 and bc_div else [])+
-                                    (["Divergência BC ICMS (a Menor)"] if diff_bc<0 and bc_div else [])
-                                ) or "Divergência Geral"
-                            else:
-                                current.update({
-                                    "Valor Total Prestação XML":0.0,"BC ICMS XML":0.0,"Valor ICMS XML":0.0,"Alíquota ICMS XML":0.0,"CST XML":"N/A",
-                                    "Tipo Tomador XML":"Não Identificado","Nome Tomador XML":"N/A","Emitente XML":"N/A","CNPJ Emitente XML":"N/A",
-                                    "Destinatário XML":"N/A","CNPJ Destinatário XML":"N/A","XML Encontrado":"Não",
-                                    "Diferença BC ICMS (SPED - XML)":bc,"Diferença ICMS (SPED - XML)":icms,"Status Auditoria":"XML Não Encontrado"
-                                })
-                            recs.append(current)
-                    try:
-                        current={
-                            "Competência":comp,
-                            "Série CT-e":fields[7].strip(),
-                            "Número CT-e":fields[9].strip(),
-                            "Chave CT-e":fields[10].strip(),
-                            "Data de Emissão SPED":fields[11].strip(),
-                            "Valor Total Prestação SPED":fields[13].replace(",",".").strip(),
-                            "BC ICMS SPED":fields[19].replace(",",".").strip(),
-                            "Valor ICMS SPED":fields[20].replace(",",".").strip()
-                        }
-                    except IndexError:
-                        warns.append(f"Aviso: D100 malformado em {os.path.basename(sped_path)} linha {line_num}.")
-                        current=None
-                    cfops, aliquotas = set(), set()
-                elif t=="D190" and current is not None and len(fields)>4:
-                    if fields[3].strip(): cfops.add(fields[3].strip())
-                    if fields[4].strip(): aliquotas.add(fields[4].strip())
-        if current is not None:
-            # fechar último
-            current['CFOPs SPED']=", ".join(sorted(cfops)) if cfops else ""
-            current['Alíquotas ICMS SPED']=", ".join(sorted(aliquotas)) if aliquotas else ""
-            bc=float(current.get("BC ICMS SPED","0").replace(",",".")) if current.get("BC ICMS SPED") else 0.0
-            icms=float(current.get("Valor ICMS SPED","0").replace(",",".")) if current.get("Valor ICMS SPED") else 0.0
-            if icms>0:
-                chave=current.get("Chave CT-e")
-                if chave and chave in xml_map:
-                    x=xml_map[chave]
-                    current.update({
-                        "Valor Total Prestação XML":x.get("Valor Total Prestação XML",0.0),
-                        "BC ICMS XML":x.get("BC ICMS XML",0.0),
-                        "Valor ICMS XML":x.get("Valor ICMS XML",0.0),
-                        "Alíquota ICMS XML":x.get("Alíquota ICMS XML",0.0),
-                        "CST XML":x.get("CST XML","N/A"),
-                        "Tipo Tomador XML":x.get("Tipo Tomador XML","Não Identificado"),
-                        "Nome Tomador XML":x.get("Nome Tomador XML","N/A"),
-                        "Emitente XML":x.get("Emitente XML","N/A"),
-                        "CNPJ Emitente XML":x.get("CNPJ Emitente XML","N/A"),
-                        "Destinatário XML":x.get("Destinatário XML","N/A"),
-                        "CNPJ Destinatário XML":x.get("CNPJ Destinatário XML","N/A"),
-                        "XML Encontrado":"Sim"
-                    })
-                    diff_bc=bc-current["BC ICMS XML"]; diff_icms=icms-current["Valor ICMS XML"]
-                    current["Diferença BC ICMS (SPED - XML)"]=diff_bc; current["Diferença ICMS (SPED - XML)"]=diff_icms
-                    icms_div=abs(diff_icms)>=0.01; bc_div=abs(diff_bc)>=0.01
-                    current["Status Auditoria"]="OK" if not icms_div and not bc_div else "Divergência: " + ", ".join(
-                        (["Crédito a Maior"] if diff_icms>0 and icms_div else [])+
-                        (["Crédito a Menor"] if diff_icms<0 and icms_div else [])+
-                        (["Divergência BC ICMS (a Maior)"] if diff_bc>0 and bc_div else [])+
-                        (["Divergência BC ICMS (a Menor)"] if diff_bc<0 and bc_div else [])
-                    ) or "Divergência Geral"
-                else:
-                    current.update({
-                        "Valor Total Prestação XML":0.0,"BC ICMS XML":0.0,"Valor ICMS XML":0.0,"Alíquota ICMS XML":0.0,"CST XML":"N/A",
-                        "Tipo Tomador XML":"Não Identificado","Nome Tomador XML":"N/A","Emitente XML":"N/A","CNPJ Emitente XML":"N/A",
-                        "Destinatário XML":"N/A","CNPJ Destinatário XML":"N/A","XML Encontrado":"Não",
-                        "Diferença BC ICMS (SPED - XML)":bc,"Diferença ICMS (SPED - XML)":icms,"Status Auditoria":"XML Não Encontrado"
-                    })
-                recs.append(current)
-    except Exception as e:
-        warns.append(f"Erro inesperado em {os.path.basename(sped_path)}: {e}")
-    return recs, warns
+# ---------- Processamento em segundo plano (auditor.tarefas) ----------
+@st.cache_resource
+def tarefas():
+    # um registro por servidor: a tarefa continua rodando, e é achada de novo, mesmo se a sessão cair
+    return Tarefas()
 
-# ---------- Excel helpers ----------
-def montar_excel(df, avisos, nome_aba):
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as w:
-        df.to_excel(w, index=False, sheet_name=nome_aba)
-        if avisos:
-            pd.DataFrame({"Avisos": avisos}).to_excel(w, index=False, sheet_name="Avisos")
-    buf.seek(0); return buf
+def _preparar(tarefa, tipo, sped_files, xml_files, workers, usar_cache, usar_indice, medir, itens):
+    # roda na thread da tarefa: mesmo fluxo da linha de comando (auditor.auditoria), sem chamar st.*; a busca no
+    # índice fica para conciliado(), porque o resultado da tarefa é guardado e o índice muda entre auditorias
+    metricas, resumo = (Metricas(tipo) if medir else None), []
+    with ExitStack() as pilha:
+        cache = pilha.enter_context(CacheXML()) if usar_cache else None
+        indice = pilha.enter_context(IndiceXML()) if usar_indice else None
+        notas, xml, avisos, *lidos = preparar(tipo, sped_files, xml_files, workers, cache, tarefa.avisar, indice, metricas, itens, buscar=False)
+        if metricas is not None: metricas.log()
+        if cache: resumo.append(f"Cache de XMLs: {cache.acertos} reaproveitado(s), {cache.faltas} extraído(s).")
+    return notas, xml, avisos, metricas, resumo, (lidos[0] if lidos else None)
 
-# ---------- UI ----------
-st.set_page_config(page_title="Auditor SPED (Web)", layout="wide")
-st.title("Auditor SPED – NF-e e CT-e (Web)")
+def processar(tipo, sped_files, xml_files):
+    # mesma chave = mesmo conteúdo e opções: devolve a tarefa em andamento ou o resultado já pronto
+    itens = itens_nfe and tipo == 'nfe'
+    chave = impressao_digital(sped_files, xml_files, tipo=tipo, indice=usar_indice, metricas=medir, itens=itens)
+    tarefas().iniciar(chave, _preparar, tipo, sped_files, xml_files, int(workers), usar_cache, usar_indice, medir, itens)
+    st.session_state[tipo] = chave; st.query_params[tipo] = chave   # o endereço da página reconecta à tarefa
+
+def mostrar_andamento(estados):
+    # SPEDs lidos em paralelo, com barra de progresso e situação de cada arquivo
+    if not estados: st.progress(0.0, text="Lendo XMLs..."); return
+    total, lidos = sum(e["tamanho"] for e in estados), sum(e["lidos"] for e in estados)
+    prontos = sum(e["estado"] == "concluído" for e in estados)
+    st.progress(min(lidos / total, 1.0) if total else prontos / len(estados),
+                text=f"Lendo SPEDs: {prontos}/{len(estados)} concluído(s), {lidos/1e6:,.0f} de {total/1e6:,.0f} MB")
+    st.dataframe(pd.DataFrame([{"Arquivo": e["nome"], "Situação": e["estado"], "Notas": e["notas"],
+        "MB lidos": round(e["lidos"]/1e6, 1), "MB/s": round(e["lidos"]/1e6/e["segundos"], 1) if e["segundos"] else None}
+        for e in estados]), hide_index=True, use_container_width=True)
+
+@st.fragment(run_every=1.0)
+def acompanhar(chave):
+    # só este trecho se atualiza enquanto a tarefa roda; ao terminar, a página toda é refeita com o resultado
+    t = tarefas().buscar(chave)
+    if t is None or t.pronta: st.rerun()
+    st.caption(f"Processando há {time.time() - t.inicio:,.0f}s (pode fechar a página: a tarefa continua, e o endereço reconecta).")
+    mostrar_andamento(t.andamento)
+
+def tarefa_pronta(tipo):
+    """Resultado da tarefa da aba (notas, xml, avisos, metricas, resumo, itens), ou None enquanto não houver."""
+    chave = st.session_state.get(tipo) or st.query_params.get(tipo)
+    if not chave: return None, None
+    t = tarefas().buscar(chave)
+    if t is None:
+        st.info("O resultado anterior não está mais disponível; processe de novo.")
+        st.session_state.pop(tipo, None); st.query_params.pop(tipo, None); return None, None
+    st.session_state[tipo] = chave
+    if not t.pronta: acompanhar(chave); return None, None
+    if t.estado == "erro":
+        st.error("O processamento falhou."); st.code(t.erro); return None, None
+    return chave, t.resultado
+
+def conciliado(tipo, chave, notas, xml, metricas, **criterios):
+    # a conciliação só roda de novo quando o resultado, os critérios ou o índice de XMLs mudam, não a cada interação
+    memo = st.session_state.setdefault("conciliados", {})
+    with IndiceXML() if usar_indice else nullcontext() as indice:
+        k = (chave, indice and indice.geracao(tipo), tuple(sorted(criterios.items())))
+        if memo.get(tipo, (None,))[0] != k:
+            if indice: xml = completar_xml(tipo, notas, xml, indice, metricas)
+            memo[tipo] = (k, conciliar(tipo, notas, xml, metricas, **criterios), indice and
+                          f"Índice de XMLs: {indice.encontradas} nota(s) achada(s) só no índice, {indice.contar(tipo)} chave(s) guardada(s).")
+            if metricas is not None: metricas.log(etapas=["Índice de XMLs: busca", "Conciliação"] if indice else ["Conciliação"])
+    if memo[tipo][2]: st.caption(memo[tipo][2])
+    return memo[tipo][1], k   # k identifica esta conciliação (itens e arquivos para baixar dependem dela)
+
+def itens_conciliados(k, itens, df, metricas, tolerancia):
+    # como conciliado(), para os itens das notas de `df` (`k`: a chave de conciliado() que gerou `df`)
+    memo = st.session_state.setdefault("conciliados", {})
+    if memo.get("itens", (None,))[0] != k:
+        memo["itens"] = (k, conciliar_itens(itens, df, metricas, tolerancia))
+        if metricas is not None: metricas.log(etapas=["Conciliação dos itens"])
+    return memo["itens"][1]
 
 tab1, tab2 = st.tabs(["NF-e (C100/C170)", "CT-e (D100/D190)"])
 
 with tab1:
     st.subheader("NF-e com cruzamento dos XMLs")
     sped_files = st.file_uploader("SPED(s) .txt", type=["txt"], accept_multiple_files=True)
-    xml_files  = st.file_uploader("XML(s) .xml ou .txt", type=["xml","txt"], accept_multiple_files=True)
+    xml_files  = st.file_uploader("XML(s) .xml ou .txt (ou compactados em .zip/.7z)", type=["xml","txt","zip","7z"], accept_multiple_files=True)
     if st.button("Processar NF-e"):
         if not sped_files: st.warning("Envie ao menos um SPED."); st.stop()
-        # salvar uploads
-        tmp_speds, tmp_xmls = [], []
-        for f in sped_files:
-            t = tempfile.NamedTemporaryFile(delete=False, suffix=".txt"); t.write(f.read()); t.close(); tmp_speds.append(t.name)
-        for f in xml_files:
-            suf = ".xml" if f.name.lower().endswith(".xml") else ".txt"
-            t = tempfile.NamedTemporaryFile(delete=False, suffix=suf); t.write(f.read()); t.close(); tmp_xmls.append(t.name)
-        # mapa de XML
-        xml_map, xml_warns = {}, []
-        for p in tmp_xmls:
-            d = parse_xml_nfe(p)
-            if d and 'Chave' in d: xml_map[d['Chave']] = d
-            else: xml_warns.append(f"XML NF-e inválido ou sem chave: {os.path.basename(p)}")
-        # processa
-        all_rows, all_warns = [], []
-        for p in tmp_speds:
-            r, w = processar_sped_nfe(p, xml_map); all_rows += r; all_warns += w
-        if not all_rows:
-            st.info("Nenhuma nota com ICMS/IPI > 0 e CFOP de entrada, pelos critérios."); st.stop()
-        cols = ["Competência","Série da nota","Número da nota","Chave","Data de emissão","Valor Total SPED","BC ICMS SPED","Valor ICMS SPED","Valor IPI SPED","CFOP","XML Encontrado","Emitente XML","CNPJ Emitente XML","Destinatário XML","CNPJ Destinatário XML","Valor Produtos XML","Valor ICMS XML","Valor IPI XML","Diferença ICMS (SPED - XML)","Diferença IPI (SPED - XML)","Status Auditoria"]
-        df = pd.DataFrame(all_rows)
-        for c in cols:
-            if c not in df.columns: df[c]=None
-        df=df[cols]
-        for c in ["Valor Total SPED","BC ICMS SPED","Valor ICMS SPED","Valor IPI SPED","Valor Produtos XML","Valor ICMS XML","Valor IPI XML","Diferença ICMS (SPED - XML)","Diferença IPI (SPED - XML)"]:
-            df[c]=pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-        st.dataframe(df, use_container_width=True)
-        xls = montar_excel(df, xml_warns+all_warns, "NF-e")
-        st.download_button("⬇️ Baixar Excel (NF-e)", data=xls, file_name="auditoria_sped_xml_nfe.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        # lê tudo uma vez, em segundo plano; a conciliação abaixo roda de novo (em memória) quando os critérios mudam
+        processar('nfe', sped_files, xml_files)
+    chave, pronto = tarefa_pronta('nfe')
+    if pronto:
+        notas, xml, avisos, metricas, resumo, itens = pronto
+        for r in resumo: st.caption(r)
+        df, versao = conciliado('nfe', chave, notas, xml, metricas, tolerancia=tolerancia, so_entradas=so_entradas_nfe)
+        if df.empty:
+            st.info("Nenhuma nota com ICMS/IPI > 0 e CFOP de entrada, pelos critérios.")
+        else:
+            st.dataframe(df, use_container_width=True)
+            df_itens = None if itens is None else itens_conciliados(versao, itens, df, metricas, tolerancia)
+            if df_itens is not None:
+                st.markdown("**Itens (C170 x det)**")
+                st.dataframe(df_itens, use_container_width=True)
+            baixar(df, avisos, "NF-e", "auditoria_sped_xml_nfe", versao, metricas, df_itens)
+        if metricas is not None: painel_metricas(metricas, "auditoria_sped_xml_nfe")
 
 with tab2:
     st.subheader("CT-e com cruzamento dos XMLs")
     sped_files = st.file_uploader("SPED(s) .txt", type=["txt"], accept_multiple_files=True, key="sped_cte")
-    xml_files  = st.file_uploader("XML(s) de CT-e .xml ou .txt", type=["xml","txt"], accept_multiple_files=True, key="xml_cte")
+    xml_files  = st.file_uploader("XML(s) de CT-e .xml ou .txt (ou compactados em .zip/.7z)", type=["xml","txt","zip","7z"], accept_multiple_files=True, key="xml_cte")
     if st.button("Processar CT-e"):
         if not sped_files: st.warning("Envie ao menos um SPED."); st.stop()
-        tmp_speds, tmp_xmls = [], []
-        for f in sped_files:
-            t=tempfile.NamedTemporaryFile(delete=False, suffix=".txt"); t.write(f.read()); t.close(); tmp_speds.append(t.name)
-        for f in xml_files:
-            suf=".xml" if f.name.lower().endswith(".xml") else ".txt"
-            t=tempfile.NamedTemporaryFile(delete=False, suffix=suf); t.write(f.read()); t.close(); tmp_xmls.append(t.name)
-        xml_map, xml_warns = {}, []
-        for p in tmp_xmls:
-            d = parse_xml_cte(p)
-            if d and 'Chave' in d: xml_map[d['Chave']] = d
-            else: xml_warns.append(f"XML CT-e inválido ou sem chave: {os.path.basename(p)}")
-        all_rows, all_warns = [], []
-        for p in tmp_speds:
-            r,w = processar_sped_cte(p, xml_map); all_rows += r; all_warns += w
-        if not all_rows:
-            st.info("Nenhum CT-e com ICMS > 0 pelos critérios."); st.stop()
-        cols = ["Competência","Série CT-e","Número CT-e","Chave CT-e","Tipo Tomador XML","Nome Tomador XML","Data de Emissão SPED","Valor Total Prestação SPED","BC ICMS SPED","Valor ICMS SPED","CFOPs SPED","Alíquotas ICMS SPED","XML Encontrado","Emitente XML","CNPJ Emitente XML","Destinatário XML","CNPJ Destinatário XML","Valor Total Prestação XML","BC ICMS XML","Valor ICMS XML","Alíquota ICMS XML","CST XML","Diferença BC ICMS (SPED - XML)","Diferença ICMS (SPED - XML)","Status Auditoria"]
-        df = pd.DataFrame(all_rows)
-        for c in cols:
-            if c not in df.columns: df[c]=None
-        df=df[cols]
-        for c in ["Valor Total Prestação SPED","BC ICMS SPED","Valor ICMS SPED","Valor Total Prestação XML","BC ICMS XML","Valor ICMS XML","Alíquota ICMS XML","Diferença BC ICMS (SPED - XML)","Diferença ICMS (SPED - XML)"]:
-            df[c]=pd.to_numeric(df[c], errors='coerce').fillna(0.0)
-        st.dataframe(df, use_container_width=True)
-        xls = montar_excel(df, xml_warns+all_warns, "CT-e")
-        st.download_button("⬇️ Baixar Excel (CT-e)", data=xls, file_name="auditoria_sped_xml_cte.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        processar('cte', sped_files, xml_files)
+    chave, pronto = tarefa_pronta('cte')
+    if pronto:
+        notas, xml, avisos, metricas, resumo, _ = pronto
+        for r in resumo: st.caption(r)
+        df, versao = conciliado('cte', chave, notas, xml, metricas, tolerancia=tolerancia, so_entradas=so_entradas_cte)
+        if df.empty:
+            st.info("Nenhum CT-e com ICMS > 0 pelos critérios.")
+        else:
+            st.dataframe(df, use_container_width=True)
+            baixar(df, avisos, "CT-e", "auditoria_sped_xml_cte", versao, metricas)
+        if metricas is not None: painel_metricas(metricas, "auditoria_sped_xml_cte")
@@ -0,0 +1,25 @@
+"""Auditoria de SPED Fiscal contra XMLs de NF-e e CT-e.
+
+Os nomes abaixo são importados sob demanda (pandas e companhia só carregam no primeiro uso).
+"""
+_NOMES = {
+    'parse_xml_nfe': 'auditor.xmls', 'parse_xml_cte': 'auditor.xmls', 'processar_xmls': 'auditor.xmls',
+    'processar_sped_nfe': 'auditor.sped', 'processar_sped_cte': 'auditor.sped', 'auditar_sped': 'auditor.sped',
+    'ler_speds': 'auditor.sped',
+    'conciliar_nfe': 'auditor.conciliacao', 'conciliar_cte': 'auditor.conciliacao',
+    'preparar': 'auditor.auditoria', 'conciliar': 'auditor.auditoria', 'conciliar_itens': 'auditor.auditoria',
+    'completar_xml': 'auditor.auditoria', 'auditar': 'auditor.auditoria',
+    'montar_excel': 'auditor.exportar', 'exportar': 'auditor.exportar',
+    'expandir_compactados': 'auditor.compactados', 'CacheXML': 'auditor.cache', 'IndiceXML': 'auditor.indice',
+}
+__all__ = list(_NOMES)
+
+def __getattr__(nome):
+    if nome not in _NOMES: raise AttributeError(f"module 'auditor' has no attribute {nome!r}")
+    import importlib
+    valor = getattr(importlib.import_module(_NOMES[nome]), nome)
+    globals()[nome] = valor
+    return valor
+
+def __dir__():
+    return sorted(set(globals()) | set(_NOMES))
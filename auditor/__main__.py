@@ -0,0 +1,4 @@
+import sys
+from auditor.cli import main
+
+sys.exit(main())
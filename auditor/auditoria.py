@@ -0,0 +1,82 @@
+import pandas as pd
+from auditor.xmls import processar_xmls
+from auditor.compactados import expandir_compactados
+from auditor.sped import ler_speds
+from auditor.conciliacao import conciliar_nfe, conciliar_cte, tabela_xml, tabela_itens_xml, CHAVES, TOLERANCIA
+from auditor.conciliacao import conciliar_itens as cruzar_itens
+from auditor.fontes import tamanho_fonte
+from auditor.metricas import etapa, contar
+
+# ---------- Fluxo completo da auditoria (usado pelo app e pela linha de comando) ----------
+ROTULOS = {'nfe': "NF-e", 'cte': "CT-e"}
+CONCILIAR = {'nfe': conciliar_nfe, 'cte': conciliar_cte}
+
+def ler_xmls(fontes, tipo, workers=None, cache=None, metricas=None, itens=False):
+    """XMLs avulsos ou em ZIP/7z -> (xml_map, avisos), com um aviso por XML inválido ou sem chave.
+
+    Com `itens` (só NF-e), a mesma leitura traz os det de cada nota e devolve (xml_map, avisos, tabela_itens_xml).
+    """
+    avisos, extrator = [], f"{tipo}_itens" if itens else tipo
+    fontes = expandir_compactados(fontes, tipo, avisos)
+    if metricas is None:
+        xml_map, invalidos = processar_xmls(fontes, extrator, workers=workers, cache=cache)
+    else:
+        # a abertura dos ZIP/7z acontece durante a leitura, XML a XML: é medida à parte e descontada
+        abertura = {"segundos": 0.0, "itens": 0, "bytes": 0}
+        with metricas.etapa("Leitura dos XMLs") as m:
+            xml_map, invalidos = processar_xmls(contar(fontes, abertura), extrator, workers=workers, cache=cache, metricas=metricas)
+            m.update(itens=abertura["itens"], bytes=abertura["bytes"], descontar=abertura["segundos"])
+        metricas.registrar("XMLs: abertura de ZIP/7z", abertura["segundos"], abertura["itens"])
+    avisos += [f"XML {ROTULOS[tipo]} inválido ou sem chave: {n}" for n in invalidos]
+    if not itens: return xml_map, avisos
+    with etapa(metricas, "Itens dos XMLs", len(xml_map)) as m:
+        xml_itens = tabela_itens_xml(xml_map)
+        if metricas is not None: m["itens"] = len(xml_itens)
+    return xml_map, avisos, xml_itens
+
+def completar_xml(tipo, notas, xml, indice, metricas=None):
+    """Tabela dos XMLs acrescida das notas sem XML no lote que estão no `indice` (auditor.indice.IndiceXML)."""
+    with etapa(metricas, "Índice de XMLs: busca", len(notas)):
+        chaves = notas[CHAVES[tipo]]
+        achados = indice.completar(tipo, {}, chaves[~chaves.isin(xml.index)])
+        return pd.concat([xml, tabela_xml(achados, tipo)]) if achados else xml
+
+def preparar(tipo, speds, xmls, workers=None, cache=None, progresso=None, indice=None, metricas=None, itens=False, buscar=True):
+    """Lê os XMLs e os SPEDs; devolve (notas, tabela_xml, avisos), prontos para conciliar() quantas vezes for preciso.
+
+    Com `indice` (auditor.indice.IndiceXML), os XMLs enviados entram no índice e as chaves das notas sem XML no
+    lote são procuradas nele; com `buscar=False`, a busca fica para completar_xml(), que pode rodar de novo quando
+    o índice mudar. Com `metricas` (auditor.metricas.Metricas), cada etapa é medida. Com `itens` (só
+    NF-e), devolve também, como 4º valor, os itens dos SPEDs e dos XMLs para conciliar_itens().
+    """
+    if itens and tipo != 'nfe': raise ValueError("A conciliação item a item só existe para NF-e.")
+    xml_map, avisos, *xml_itens = ler_xmls(xmls, tipo, workers, cache, metricas, itens)
+    with etapa(metricas, "Leitura dos SPEDs") as m:
+        notas, avisos_sped, *sped_itens = ler_speds(speds, tipo, workers, progresso, metricas, itens)
+        if metricas is not None: m.update(itens=len(notas), bytes=sum(tamanho_fonte(f) or 0 for f in speds))
+    if indice is not None:
+        with etapa(metricas, "Índice de XMLs", len(xml_map)):
+            indice.adicionar(tipo, xml_map)
+    with etapa(metricas, "Tabela dos XMLs", len(xml_map)):
+        xml = tabela_xml(xml_map, tipo)
+    if indice is not None and buscar: xml = completar_xml(tipo, notas, xml, indice, metricas)
+    if itens: return notas, xml, avisos + avisos_sped, (sped_itens[0], xml_itens[0])
+    return notas, xml, avisos + avisos_sped
+
+def conciliar(tipo, notas, xml, metricas=None, **opcoes):
+    """Cruza notas e XMLs com os critérios em `opcoes` (tolerancia, so_entradas)."""
+    with etapa(metricas, "Conciliação", len(notas)):
+        return CONCILIAR[tipo](notas, xml, **opcoes)
+
+def conciliar_itens(itens, df, metricas=None, tolerancia=TOLERANCIA):
+    """Cruza item a item (C170 x det) os itens de preparar(..., itens=True) das notas de `df` (resultado de conciliar)."""
+    with etapa(metricas, "Conciliação dos itens", len(itens[0])):
+        return cruzar_itens(*itens, df, tolerancia)
+
+def auditar(tipo, speds, xmls, workers=None, cache=None, progresso=None, indice=None, metricas=None, itens=False, **opcoes):
+    """Auditoria completa de um lote de SPEDs contra os XMLs; devolve (DataFrame, avisos) ou, com `itens`,
+    (DataFrame, avisos, DataFrame dos itens)."""
+    notas, xml, avisos, *lidos = preparar(tipo, speds, xmls, workers, cache, progresso, indice, metricas, itens)
+    df = conciliar(tipo, notas, xml, metricas, **opcoes)
+    if not itens: return df, avisos
+    return df, avisos, conciliar_itens(lidos[0], df, metricas, opcoes.get('tolerancia', TOLERANCIA))
@@ -0,0 +1,89 @@
+import sqlite3, hashlib, json, os, time
+from auditor import xmls
+
+# ---------- Cache em disco das extrações de XML ----------
+CAMINHO_PADRAO = os.environ.get("AUDITOR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "auditor_sped", "xml_cache.sqlite3"))
+LIMITE_PADRAO = 256 * 1024 * 1024   # bytes de JSON guardados antes de despejar os menos usados
+_LOTE_SQL = 500                     # chaves por consulta (limite de variáveis do SQLite)
+
+def versao_extrator():
+    # número declarado + hash do código dos parsers: qualquer mudança em xmls.py invalida o cache
+    try:
+        with open(xmls.__file__, 'rb') as f: fonte = f.read()
+    except OSError:
+        fonte = b''
+    return f"{xmls.VERSAO_EXTRATOR}:{hashlib.blake2b(fonte, digest_size=8).hexdigest()}"
+
+def hash_conteudo(conteudo):
+    return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+class CacheXML:
+    """Cache SQLite {(hash do conteúdo, tipo): dict extraído} com despejo LRU por tamanho."""
+
+    def __init__(self, caminho=CAMINHO_PADRAO, limite_bytes=LIMITE_PADRAO):
+        self.caminho, self.limite_bytes, self.versao = caminho, limite_bytes, versao_extrator()
+        self.acertos = self.faltas = 0
+        if caminho != ":memory:": os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self.con = sqlite3.connect(caminho, timeout=30)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS xml_cache (
+            hash TEXT NOT NULL, tipo TEXT NOT NULL, versao TEXT NOT NULL, dados TEXT NOT NULL,
+            tamanho INTEGER NOT NULL, acesso REAL NOT NULL, PRIMARY KEY (hash, tipo))""")
+        self.con.execute("CREATE INDEX IF NOT EXISTS ix_xml_cache_acesso ON xml_cache (acesso)")
+        with self.con:
+            self.con.execute("DELETE FROM xml_cache WHERE versao <> ?", (self.versao,))
+        # total de bytes mantido à mão (somado a cada gravação); a tabela só é somada de novo quando ele passa do limite
+        self._total = self.con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM xml_cache").fetchone()[0]
+
+    hash_conteudo = staticmethod(hash_conteudo)
+
+    def buscar(self, tipo, hashes):
+        """Devolve {hash: dict|None} para os hashes já extraídos; atualiza contadores e o acesso (LRU)."""
+        hashes = list(dict.fromkeys(hashes)); achados = {}
+        for i in range(0, len(hashes), _LOTE_SQL):
+            parte = hashes[i:i+_LOTE_SQL]
+            sql = f"SELECT hash, dados FROM xml_cache WHERE tipo = ? AND hash IN ({','.join('?'*len(parte))})"
+            for h, dados in self.con.execute(sql, [tipo, *parte]): achados[h] = json.loads(dados)
+        if achados:
+            agora = time.time()
+            with self.con:
+                self.con.executemany("UPDATE xml_cache SET acesso = ? WHERE hash = ? AND tipo = ?", [(agora, h, tipo) for h in achados])
+        self.acertos += len(achados); self.faltas += len(hashes) - len(achados)
+        return achados
+
+    def gravar(self, tipo, itens):
+        """Grava [(hash, dict|None)] e despeja as entradas menos usadas se passar do limite."""
+        agora = time.time(); linhas = []
+        for h, d in itens:
+            dados = json.dumps(d, ensure_ascii=False)
+            linhas.append((h, tipo, self.versao, dados, len(dados.encode('utf-8')), agora))
+        with self.con:
+            self.con.executemany("INSERT OR REPLACE INTO xml_cache VALUES (?,?,?,?,?,?)", linhas)
+        self._total += sum(l[4] for l in linhas)
+        if self._total > self.limite_bytes: self._despejar()
+
+    def _despejar(self):
+        # o total à mão pode passar do real (entradas substituídas, outro processo limpando): confere antes de despejar
+        total = self._total = self.con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM xml_cache").fetchone()[0]
+        if total <= self.limite_bytes: return
+        excesso, remover = total - self.limite_bytes, []
+        for h, tipo, tam in self.con.execute("SELECT hash, tipo, tamanho FROM xml_cache ORDER BY acesso"):
+            remover.append((h, tipo)); excesso -= tam; self._total -= tam
+            if excesso <= 0: break
+        with self.con:
+            self.con.executemany("DELETE FROM xml_cache WHERE hash = ? AND tipo = ?", remover)
+
+    def limpar(self):
+        with self.con:
+            self.con.execute("DELETE FROM xml_cache")
+        self._total = 0
+
+    def estatisticas(self):
+        n, total = self.con.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM xml_cache").fetchone()
+        return {"acertos": self.acertos, "faltas": self.faltas, "entradas": n, "bytes": total}
+
+    def fechar(self):
+        self.con.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.fechar()
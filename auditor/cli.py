@@ -0,0 +1,117 @@
+import argparse, glob, os, sys, time
+
+# ---------- Linha de comando ----------
+# python -m auditor nfe --sped 'speds/2024/*.txt' --xml xmls/ -o auditoria.xlsx
+# Só argparse/glob no topo: pandas e o resto do núcleo são importados depois de validar os argumentos.
+EXTENSOES = {'sped': ('.txt',), 'xml': ('.xml', '.txt', '.zip', '.7z')}
+FORMATOS_SAIDA = ('xlsx', 'csv', 'parquet')
+
+def expandir_entradas(entradas, extensoes):
+    """Caminhos de arquivo a partir de arquivos, diretórios (recursivo, filtrando `extensoes`) e globs."""
+    arquivos = []
+    for e in entradas:
+        if os.path.isdir(e):
+            achados = [os.path.join(r, n) for r, _, ns in os.walk(e) for n in ns if n.lower().endswith(extensoes)]
+        elif glob.has_magic(e):
+            achados = [p for p in glob.glob(e, recursive=True) if os.path.isfile(p)]
+        elif os.path.isfile(e):
+            achados = [e]
+        else:
+            raise FileNotFoundError(f"Entrada não encontrada: {e}")
+        arquivos += sorted(achados)
+    return list(dict.fromkeys(arquivos))
+
+def _formato(args):
+    if args.formato: return args.formato
+    ext = os.path.splitext(args.saida)[1].lower().lstrip('.')
+    return ext if ext in FORMATOS_SAIDA else 'xlsx'
+
+def _progresso(silencioso):
+    vistos = set()
+    def progresso(estados):
+        for e in estados:
+            if e["estado"] != "concluído" or e["nome"] in vistos: continue
+            vistos.add(e["nome"])
+            if silencioso: continue
+            mbs = e["lidos"] / 1e6 / e["segundos"] if e["segundos"] else 0.0
+            print(f"  {e['nome']}: {e['notas']} nota(s), {e['lidos']/1e6:,.1f} MB em {e['segundos']:.1f}s ({mbs:,.0f} MB/s)", file=sys.stderr)
+    return progresso
+
+def _gravar_metricas(metricas, destino):
+    # uma linha JSON por etapa/destaque (auditor.metricas.Metricas.log), no arquivo pedido ou no stderr
+    import logging
+    from auditor.metricas import LOGGER
+    h = logging.StreamHandler(sys.stderr) if destino == "-" else logging.FileHandler(destino, encoding="utf-8")
+    h.setFormatter(logging.Formatter("%(message)s")); LOGGER.addHandler(h); LOGGER.setLevel(logging.INFO)
+    try: metricas.log()
+    finally: LOGGER.removeHandler(h); h.close()
+
+def criar_parser():
+    p = argparse.ArgumentParser(prog="python -m auditor", description="Audita SPEDs (C100/D100) contra os XMLs de NF-e ou CT-e.")
+    p.add_argument("tipo", choices=("nfe", "cte"), help="modelo auditado")
+    p.add_argument("--sped", nargs="+", required=True, metavar="ENTRADA", help="arquivos, diretórios ou globs de SPED (.txt)")
+    p.add_argument("--xml", nargs="*", default=[], metavar="ENTRADA", help="arquivos, diretórios ou globs de XML (.xml/.txt/.zip/.7z)")
+    p.add_argument("-o", "--saida", required=True, help="arquivo de saída (.xlsx, .csv ou .parquet)")
+    p.add_argument("--formato", choices=FORMATOS_SAIDA, help="formato de saída (padrão: pela extensão de --saida)")
+    p.add_argument("-w", "--workers", type=int, default=None, help="processos de leitura (padrão: todos os núcleos)")
+    p.add_argument("--tolerancia", type=float, default=None, help="diferença mínima (R$) para apontar divergência (padrão: 0,01)")
+    p.add_argument("--todas-cfops", action="store_true", help="NF-e: não exige CFOP de entrada")
+    p.add_argument("--so-entradas", action="store_true", help="CT-e: só CT-e com CFOP de entrada")
+    p.add_argument("--itens", action="store_true",
+                   help="NF-e: concilia também item a item (C170 x det); aba \"Itens\" no .xlsx ou <saida>_itens.<formato>")
+    p.add_argument("--sem-cache", action="store_true", help="não usa o cache em disco de XMLs")
+    p.add_argument("--cache", default=None, metavar="ARQUIVO", help="caminho do cache de XMLs (padrão: AUDITOR_CACHE ou ~/.cache)")
+    p.add_argument("--sem-indice", action="store_true", help="não usa o índice permanente de XMLs (entre competências)")
+    p.add_argument("--indice", default=None, metavar="ARQUIVO", help="caminho do índice de XMLs (padrão: AUDITOR_INDICE ou ~/.cache)")
+    p.add_argument("--metricas", default=None, metavar="ARQUIVO", help="mede cada etapa e grava as métricas em linhas JSON ('-' = stderr)")
+    p.add_argument("-q", "--silencioso", action="store_true", help="não mostra o andamento")
+    return p
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    try:
+        speds = expandir_entradas(args.sped, EXTENSOES['sped'])
+        xmls = expandir_entradas(args.xml, EXTENSOES['xml'])
+    except FileNotFoundError as e:
+        print(f"Erro: {e}", file=sys.stderr); return 2
+    if not speds:
+        print("Erro: nenhum SPED encontrado nas entradas.", file=sys.stderr); return 2
+    if args.itens and args.tipo != 'nfe':
+        print("Erro: --itens só vale para NF-e.", file=sys.stderr); return 2
+    formato, log = _formato(args), (lambda msg: None) if args.silencioso else (lambda msg: print(msg, file=sys.stderr))
+
+    from auditor.auditoria import preparar, conciliar, conciliar_itens, ROTULOS
+    from auditor.conciliacao import TOLERANCIA
+    from auditor.cache import CacheXML, CAMINHO_PADRAO
+    from auditor.indice import IndiceXML, CAMINHO_PADRAO as INDICE_PADRAO
+    from contextlib import ExitStack
+    from auditor.exportar import exportar, escrever_csv
+    from auditor.metricas import Metricas, etapa
+    import pandas as pd
+    inicio = time.perf_counter()
+    log(f"{len(speds)} SPED(s), {len(xmls)} arquivo(s) de XML.")
+    opcoes = {} if args.tolerancia is None else {'tolerancia': args.tolerancia}
+    opcoes['so_entradas'] = not args.todas_cfops if args.tipo == 'nfe' else args.so_entradas
+    metricas = Metricas(args.tipo) if args.metricas else None
+    with ExitStack() as pilha:
+        cache = None if args.sem_cache else pilha.enter_context(CacheXML(args.cache or CAMINHO_PADRAO))
+        indice = None if args.sem_indice else pilha.enter_context(IndiceXML(args.indice or INDICE_PADRAO))
+        notas, xml, avisos, *itens = preparar(args.tipo, speds, xmls, args.workers, cache, _progresso(args.silencioso), indice,
+                                              metricas, args.itens)
+        if cache: log(f"Cache de XMLs: {cache.acertos} reaproveitado(s), {cache.faltas} extraído(s).")
+        if indice: log(f"Índice de XMLs: {indice.encontradas} nota(s) achada(s) só no índice, {indice.contar(args.tipo)} chave(s) guardada(s).")
+    df = conciliar(args.tipo, notas, xml, metricas, **opcoes)
+    df_itens = conciliar_itens(itens[0], df, metricas, opcoes.get('tolerancia', TOLERANCIA)) if itens else None
+    base = os.path.splitext(args.saida)[0]
+    with etapa(metricas, f"Exportação ({formato})", len(df)) as m:
+        exportar(df, avisos, formato, ROTULOS[args.tipo], args.saida, metricas, df_itens)
+        if formato != 'xlsx' and df_itens is not None: exportar(df_itens, [], formato, "Itens", f"{base}_itens.{formato}")
+        if metricas is not None: m["bytes"] = os.path.getsize(args.saida)
+    if formato != 'xlsx' and df_itens is not None: log(f"Itens: {base}_itens.{formato}")
+    if formato != 'xlsx' and avisos:
+        escrever_csv(pd.DataFrame({"Avisos": avisos}), f"{base}_avisos.csv"); log(f"Avisos: {base}_avisos.csv")
+    if df_itens is not None: log(f"{len(df_itens)} item(ns): {df_itens['Status Auditoria'].ne('OK').sum()} fora do OK.")
+    log(f"{len(df)} linha(s), {len(avisos)} aviso(s) -> {args.saida} ({time.perf_counter() - inicio:.1f}s)")
+    if metricas is not None:
+        log(metricas.dataframe().astype(object).fillna("").to_string(index=False)); _gravar_metricas(metricas, args.metricas)
+    return 0
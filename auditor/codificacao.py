@@ -0,0 +1,79 @@
+import codecs, hashlib, os, re
+from collections import OrderedDict
+from auditor.fontes import abrir_binario, conteudo_fonte, memoria, nome_fonte
+
+# ---------- Detecção de codificação (SPED e XML) ----------
+# O SPED é texto ISO-8859-1 pelo Guia Prático, mas há gerador que grava UTF-8 ou cp1252; o XML declara a
+# codificação no prólogo (sem declaração, UTF-8). Em vez de adivinhar por estatística (chardet), a regra é:
+# BOM -> prólogo XML -> UTF-8 estrito -> cp1252 (se houver bytes 0x80-0x9F) ou latin-1.
+AMOSTRA = 64 * 1024
+PADRAO_SPED = 'latin-1'
+LIMITE_CACHE = 256
+
+_PROLOGO = re.compile(rb'^<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+_C1 = re.compile(rb'[\x80-\x9f]')
+_NAO_ASCII = re.compile(rb'[\x80-\xff]')
+_cache = OrderedDict()
+
+def _normalizar(enc):
+    try: return codecs.lookup(enc).name
+    except LookupError: return None
+
+def codificacao_xml(cabecalho):
+    """Codificação declarada no prólogo do XML (UTF-8 se não houver declaração), ou None se não for XML."""
+    cabecalho = bytes(cabecalho[:200]).lstrip(codecs.BOM_UTF8)
+    if not cabecalho.lstrip().startswith(b'<'): return None
+    m = _PROLOGO.match(cabecalho.lstrip())
+    return (_normalizar(m.group(1).decode('ascii')) if m else None) or 'utf-8'
+
+def codificacao_bytes(dados):
+    """Codificação de um trecho de SPED: 'utf-8', 'cp1252', 'latin-1', ou None se o trecho for só ASCII.
+
+    Só ASCII não decide nada (o texto é o mesmo em qualquer uma delas): quem lê em blocos continua olhando
+    os próximos. A decisão sai da AMOSTRA que começa no primeiro byte não ASCII.
+    """
+    if dados[:3] == codecs.BOM_UTF8: return 'utf-8'
+    ini = 0
+    while ini < len(dados) and dados[ini:ini+AMOSTRA].isascii(): ini += AMOSTRA   # isascii é bem mais rápido que regex
+    if ini >= len(dados): return None
+    ini = _NAO_ASCII.search(dados, ini).start(); amostra = dados[ini:ini+AMOSTRA]
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False); return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252' if _C1.search(amostra) else PADRAO_SPED
+
+def chave_fonte(fonte):
+    # identifica o arquivo sem ler tudo: caminho + tamanho + mtime, ou nome + tamanho + hash das pontas
+    mem = memoria(fonte)
+    if mem is None:
+        caminho = os.path.abspath(conteudo_fonte(fonte)); st = os.stat(caminho)
+        return ('arq', caminho, st.st_size, st.st_mtime_ns)
+    with mem:
+        m = mem.cast('B'); h = hashlib.blake2b(m[:AMOSTRA], digest_size=16); h.update(m[-AMOSTRA:])
+        return ('mem', nome_fonte(fonte), m.nbytes, h.hexdigest())
+
+def lembrar(fonte, enc):
+    try: chave = chave_fonte(fonte)
+    except (OSError, TypeError, ValueError): return
+    _cache[chave] = enc; _cache.move_to_end(chave)
+    while len(_cache) > LIMITE_CACHE: _cache.popitem(last=False)
+
+def lembrada(fonte):
+    """Codificação já decidida para este arquivo (cache em memória), ou None."""
+    try: chave = chave_fonte(fonte)
+    except (OSError, TypeError, ValueError): return None
+    enc = _cache.get(chave)
+    if enc is not None: _cache.move_to_end(chave)
+    return enc
+
+def detectar_encoding(fonte):
+    """Codificação de um SPED ou XML pelo início do arquivo; SPED só ASCII no início fica com latin-1."""
+    enc = lembrada(fonte)
+    if enc: return enc
+    try:
+        with abrir_binario(fonte) as f: amostra = f.read(AMOSTRA)
+    except (OSError, TypeError, ValueError):
+        return PADRAO_SPED
+    enc = codificacao_xml(amostra) or codificacao_bytes(amostra)
+    if enc: lembrar(fonte, enc)
+    return enc or PADRAO_SPED
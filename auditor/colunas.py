@@ -0,0 +1,54 @@
+from array import array
+
+# ---------- Resultado em colunas ----------
+def num(texto):
+    # mesma regra de pd.to_numeric(errors='coerce').fillna(0.0) para um valor do SPED
+    try: v = float(texto)
+    except (TypeError, ValueError): return 0.0
+    return 0.0 if v != v else v
+
+class Colunas:
+    """Buffers por coluna (array('d') para valores, list para texto) que viram um DataFrame sem dicts por linha.
+
+    `adicionar` recebe a linha na ordem de `colunas`, sem as colunas de `por_arquivo`; estas têm um valor por
+    trecho de linhas (ex.: a competência de cada SPED) e são preenchidas com `marcar`.
+    """
+
+    def __init__(self, colunas, numericas, por_arquivo=()):
+        self.colunas, self.por_arquivo = list(colunas), tuple(por_arquivo)
+        self.numericas = set(numericas)
+        self.dados = {c: array('d') if c in self.numericas else [] for c in self.colunas if c not in self.por_arquivo}
+        self._append = [self.dados[c].append for c in self.colunas if c not in self.por_arquivo]
+        self._extend = [self.dados[c].extend for c in self.colunas if c not in self.por_arquivo]
+        self._trechos = {c: [] for c in self.por_arquivo}
+        self.n = 0
+
+    def __len__(self): return self.n
+
+    def adicionar(self, valores):
+        for ap, v in zip(self._append, valores): ap(v)
+        self.n += 1
+
+    def estender(self, valores):
+        """Como adicionar, mas com uma sequência por coluna (todas do mesmo tamanho): vários itens de uma vez."""
+        for ex, v in zip(self._extend, valores): ex(v)
+        self.n += len(valores[0]) if valores else 0
+
+    def marcar(self, coluna, valor):
+        """Usa `valor` em `coluna` para as linhas adicionadas desde a última marcação."""
+        self._trechos[coluna].append((self.n, valor))
+
+    def dataframe(self):
+        import numpy as np, pandas as pd
+        cols = {}
+        for c in self.colunas:
+            if c in self._trechos:
+                col, ini = [], 0
+                for fim, valor in self._trechos[c]: col += [valor] * (fim - ini); ini = fim
+                cols[c] = col + [None] * (self.n - ini)
+            elif c in self.numericas:
+                v = np.frombuffer(self.dados[c], dtype=np.float64).copy(); v[np.isnan(v)] = 0.0
+                cols[c] = v
+            else:
+                cols[c] = self.dados[c]
+        return pd.DataFrame(cols, columns=self.colunas)
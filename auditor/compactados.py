@@ -0,0 +1,104 @@
+import zipfile, zlib
+from auditor.fontes import abrir_binario, nome_fonte
+
+# ---------- Arquivos compactados (ZIP / 7z) ----------
+EXTENSOES_XML = ('.xml', '.txt')
+PROFUNDIDADE_MAX = 5            # ZIP dentro de ZIP dentro de ... (proteção contra arquivos malformados)
+LIMITE_MEMBRO = 256 * 1024 * 1024   # bytes descompactados por membro, em qualquer nível (ZIP ou 7z)
+LIMITE_MEMBRO_7Z = LIMITE_MEMBRO
+LIMITE_7Z = 1024 * 1024 * 1024      # bytes descompactados de um .7z inteiro (os membros ficam todos em memória)
+_NS_TIPO = {'nfe': b'portalfiscal.inf.br/nfe', 'cte': b'portalfiscal.inf.br/cte'}
+
+def tipo_compactado(nome, cabecalho=b''):
+    n = nome.lower()
+    if n.endswith('.zip') or cabecalho.startswith(b'PK\x03\x04'): return 'zip'
+    if n.endswith('.7z') or cabecalho.startswith(b"7z\xbc\xaf'\x1c"): return '7z'
+    return None
+
+def tipo_xml(conteudo):
+    """'nfe', 'cte' ou None, pelo namespace declarado no início do XML."""
+    inicio = bytes(conteudo[:4096])
+    for tipo, ns in _NS_TIPO.items():
+        if ns in inicio: return tipo
+    return None
+
+def _membros_zip(nome, arq, avisos):
+    try:
+        zf = zipfile.ZipFile(arq)
+    except (zipfile.BadZipFile, OSError) as e:
+        avisos.append(f"Arquivo compactado inválido: {nome} ({e})"); return
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir(): continue
+            membro = f"{nome}/{info.filename}"
+            if not (info.filename.lower().endswith(EXTENSOES_XML) or tipo_compactado(info.filename)): continue
+            if info.file_size > LIMITE_MEMBRO:
+                avisos.append(f"Membro grande demais ignorado: {membro} ({info.file_size/1e6:,.0f} MB descompactado)"); continue
+            try:
+                # o tamanho declarado pode mentir: nunca lê além do limite
+                with zf.open(info) as m: dados = m.read(LIMITE_MEMBRO + 1)
+            except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, OSError, EOFError) as e:
+                avisos.append(f"Erro ao ler {membro}: {e}"); continue
+            if len(dados) > LIMITE_MEMBRO:
+                avisos.append(f"Membro grande demais ignorado: {membro} (mais de {LIMITE_MEMBRO/1e6:,.0f} MB descompactado)"); continue
+            yield membro, dados
+
+def _membros_7z(nome, arq, avisos):
+    try:
+        import py7zr
+        from py7zr.io import BytesIOFactory
+    except ImportError:
+        avisos.append(f"Arquivo .7z ignorado (instale py7zr): {nome}"); return
+    try:
+        with py7zr.SevenZipFile(arq, 'r', max_extract_size=LIMITE_7Z) as z:
+            alvos = []
+            for info in z.list():
+                n = info.filename
+                if info.is_directory or not (n.lower().endswith(EXTENSOES_XML) or tipo_compactado(n)): continue
+                # no 7z o tamanho declarado é o que o py7zr descompacta de cada membro
+                if info.uncompressed > LIMITE_MEMBRO:
+                    avisos.append(f"Membro grande demais ignorado: {nome}/{n} ({info.uncompressed/1e6:,.0f} MB descompactado)"); continue
+                alvos.append(n)
+            fabrica = BytesIOFactory(LIMITE_MEMBRO + 1)  # 7z costuma ser "solid": descompacta tudo numa passada
+            if alvos: z.extract(targets=alvos, factory=fabrica)
+    except py7zr.DecompressionBombError:
+        avisos.append(f"Arquivo compactado grande demais ignorado: {nome} (mais de {LIMITE_7Z/1e6:,.0f} MB descompactado)"); return
+    except Exception as e:
+        avisos.append(f"Arquivo compactado inválido: {nome} ({e})"); return
+    for n in list(fabrica.products):
+        p = fabrica.products.pop(n)
+        if p.size() > LIMITE_MEMBRO:   # a fábrica do py7zr só para de gravar: o membro viria cortado
+            avisos.append(f"Membro grande demais ignorado: {nome}/{n} (mais de {LIMITE_MEMBRO/1e6:,.0f} MB descompactado)"); continue
+        p.seek(0); yield f"{nome}/{n}", p.read()
+
+def _expandir(nome, fonte, formato, tipo, avisos, ignorados, nivel):
+    if nivel > PROFUNDIDADE_MAX:
+        avisos.append(f"Arquivo compactado com aninhamento excessivo ignorado: {nome}"); return
+    with abrir_binario(fonte) as arq:
+        membros = _membros_zip(nome, arq, avisos) if formato == 'zip' else _membros_7z(nome, arq, avisos)
+        for membro, dados in membros:
+            interno = tipo_compactado(membro, dados[:8])
+            if interno:
+                yield from _expandir(membro, dados, interno, tipo, avisos, ignorados, nivel + 1); continue
+            outro = tipo_xml(dados)
+            if tipo and outro and outro != tipo:
+                ignorados[outro] = ignorados.get(outro, 0) + 1; continue
+            yield membro, dados
+
+def expandir_compactados(fontes, tipo=None, avisos=None):
+    """Gera as fontes de XML, abrindo ZIPs/7z (inclusive aninhados) em memória, membro a membro.
+
+    Fontes que não são arquivos compactados passam direto. Membros são gerados como ("arquivo.zip/membro.xml", bytes);
+    com `tipo`, membros reconhecidos como do outro modelo (NF-e x CT-e) são pulados e contados em `avisos`,
+    junto com os erros de leitura de cada membro.
+    """
+    avisos = avisos if avisos is not None else []
+    for fonte in fontes:
+        nome = nome_fonte(fonte)
+        with abrir_binario(fonte) as f: formato = tipo_compactado(nome, f.read(8))
+        if not formato:
+            yield fonte; continue
+        ignorados = {}
+        yield from _expandir(nome, fonte, formato, tipo, avisos, ignorados, 1)
+        for outro, n in ignorados.items():
+            avisos.append(f"{n} XML(s) de {'CT-e' if outro == 'cte' else 'NF-e'} ignorado(s) em {nome}.")
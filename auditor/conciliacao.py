@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+from auditor.colunas import Colunas
+
+# ---------- Conciliação SPED x XML (vetorizada) ----------
+# Etapa separada da leitura: recebe o DataFrame de notas do SPED (auditor.sped) e a tabela dos XMLs,
+# cruza pela chave e calcula diferenças/status em colunas. Mudar tolerância ou filtros não relê nada.
+TOLERANCIA = 0.01
+CFOP_ENTRADA = ("1", "2", "3")
+
+COLUNAS_NFE = ["Competência","Série da nota","Número da nota","Chave","Data de emissão","Valor Total SPED","BC ICMS SPED","Valor ICMS SPED","Valor IPI SPED","CFOP","XML Encontrado","Emitente XML","CNPJ Emitente XML","Destinatário XML","CNPJ Destinatário XML","Valor Produtos XML","Valor ICMS XML","Valor IPI XML","Diferença ICMS (SPED - XML)","Diferença IPI (SPED - XML)","Status Auditoria"]
+NUMERICAS_NFE = ["Valor Total SPED","BC ICMS SPED","Valor ICMS SPED","Valor IPI SPED","Valor Produtos XML","Valor ICMS XML","Valor IPI XML","Diferença ICMS (SPED - XML)","Diferença IPI (SPED - XML)"]
+COLUNAS_CTE = ["Competência","Série CT-e","Número CT-e","Chave CT-e","Tipo Tomador XML","Nome Tomador XML","Data de Emissão SPED","Valor Total Prestação SPED","BC ICMS SPED","Valor ICMS SPED","CFOPs SPED","Alíquotas ICMS SPED","XML Encontrado","Emitente XML","CNPJ Emitente XML","Destinatário XML","CNPJ Destinatário XML","Valor Total Prestação XML","BC ICMS XML","Valor ICMS XML","Alíquota ICMS XML","CST XML","Diferença BC ICMS (SPED - XML)","Diferença ICMS (SPED - XML)","Status Auditoria"]
+NUMERICAS_CTE = ["Valor Total Prestação SPED","BC ICMS SPED","Valor ICMS SPED","Valor Total Prestação XML","BC ICMS XML","Valor ICMS XML","Alíquota ICMS XML","Diferença BC ICMS (SPED - XML)","Diferença ICMS (SPED - XML)"]
+
+CHAVES = {'nfe': "Chave", 'cte': "Chave CT-e"}   # coluna da chave de acesso nas notas
+
+# campo do XML -> valor quando o campo (ou o XML inteiro) não existe
+CAMPOS_XML = {
+    'nfe': {"Emitente XML": "N/A", "CNPJ Emitente XML": "N/A", "Destinatário XML": "N/A", "CNPJ Destinatário XML": "N/A",
+            "Valor Produtos XML": 0.0, "Valor ICMS XML": 0.0, "Valor IPI XML": 0.0},
+    'cte': {"Tipo Tomador XML": "Não Identificado", "Nome Tomador XML": "N/A", "Emitente XML": "N/A", "CNPJ Emitente XML": "N/A",
+            "Destinatário XML": "N/A", "CNPJ Destinatário XML": "N/A", "Valor Total Prestação XML": 0.0, "BC ICMS XML": 0.0,
+            "Valor ICMS XML": 0.0, "Alíquota ICMS XML": 0.0, "CST XML": "N/A"},
+}
+
+def tabela_xml(xml_map, tipo):
+    """DataFrame dos XMLs indexado pela chave, com os campos usados na conciliação (faltantes com o valor padrão)."""
+    if isinstance(xml_map, pd.DataFrame): return xml_map
+    campos, dados = CAMPOS_XML[tipo], list(xml_map.values())
+    return pd.DataFrame({c: [d.get(c, p) for d in dados] for c, p in campos.items()},
+                        index=pd.Index(list(xml_map.keys()), name="Chave"), columns=list(campos))
+
+def _cruzar(notas, xml, chave, tipo):
+    # junção por hash na chave (reindex preserva a ordem das notas); XML ausente -> valores padrão
+    achado = notas[chave].isin(xml.index)
+    x = xml.reindex(notas[chave]).set_axis(notas.index)
+    for c, p in CAMPOS_XML[tipo].items(): x[c] = x[c].where(achado, p)
+    return achado.to_numpy(), x
+
+def _status(achado, diffs, nomes, tolerancia):
+    # cada diferença vira 0 (ok), 1 (a maior) ou 2 (a menor); a combinação indexa a tabela de textos
+    codigo, partes = np.zeros(len(achado), dtype=np.int64), []
+    for d, (maior, menor) in zip(diffs, nomes):
+        div = np.abs(d) >= tolerancia
+        codigo = codigo * 3 + np.where(div & (d > 0), 1, np.where(div & (d < 0), 2, 0)); partes.append(("", maior, menor))
+    textos = []
+    for i in range(3 ** len(partes)):
+        estados, k = [], i
+        for p in reversed(partes): estados.append(p[k % 3]); k //= 3
+        lst = [s for s in reversed(estados) if s]
+        textos.append("Divergência: " + ", ".join(lst) if lst else "OK")
+    textos.append("XML Não Encontrado")
+    return np.array(textos, dtype=object)[np.where(achado, codigo, len(textos) - 1)]
+
+def _conciliar(notas, xml, tipo, chave, filtro, valores, nomes, tolerancia):
+    # valores: [(coluna SPED, coluna XML, coluna da diferença)], na ordem em que entram no status
+    colunas, numericas = (COLUNAS_NFE, NUMERICAS_NFE) if tipo == 'nfe' else (COLUNAS_CTE, NUMERICAS_CTE)
+    notas = notas[filtro]
+    achado, x = _cruzar(notas, tabela_xml(xml, tipo), chave, tipo)
+    df = pd.concat([notas, x], axis=1)
+    df["XML Encontrado"] = np.where(achado, "Sim", "Não")
+    diffs = []
+    for sped, campo, dif in valores:
+        df[dif] = df[sped].to_numpy(np.float64) - df[campo].to_numpy(np.float64); diffs.append(df[dif].to_numpy())
+    df["Status Auditoria"] = _status(achado, diffs, nomes, tolerancia)
+    for c in numericas: df[c] = df[c].astype(np.float64).fillna(0.0)
+    return df[colunas].reset_index(drop=True)
+
+def conciliar_nfe(notas, xml, tolerancia=TOLERANCIA, so_entradas=True):
+    """Cruza as notas C100 (DataFrame de auditor.sped.ler_notas_nfe) com os XMLs de NF-e.
+
+    `xml` é o xml_map de processar_xmls ou a tabela_xml já montada. Entram as notas com ICMS ou IPI > 0 e,
+    com `so_entradas`, só as que têm CFOP de entrada.
+    """
+    filtro = (notas["Valor ICMS SPED"] > 0) | (notas["Valor IPI SPED"] > 0)
+    if so_entradas: filtro &= notas["Entrada"].astype(bool)
+    return _conciliar(notas, xml, 'nfe', CHAVES['nfe'], filtro,
+        [("Valor ICMS SPED", "Valor ICMS XML", "Diferença ICMS (SPED - XML)"), ("Valor IPI SPED", "Valor IPI XML", "Diferença IPI (SPED - XML)")],
+        [("Crédito a Maior", "Crédito a Menor"), ("Divergência IPI (a Maior)", "Divergência IPI (a Menor)")], tolerancia)
+
+def conciliar_cte(notas, xml, tolerancia=TOLERANCIA, so_entradas=False):
+    """Cruza os CT-e D100 (DataFrame de auditor.sped.ler_notas_cte) com os XMLs de CT-e.
+
+    Entram os CT-e com ICMS > 0; com `so_entradas`, só os que têm CFOP de entrada no D190.
+    """
+    filtro = notas["Valor ICMS SPED"] > 0
+    if so_entradas: filtro &= notas["Entrada"].astype(bool)
+    # a ordem dos textos segue a regra original: ICMS primeiro, depois BC
+    return _conciliar(notas, xml, 'cte', CHAVES['cte'], filtro,
+        [("Valor ICMS SPED", "Valor ICMS XML", "Diferença ICMS (SPED - XML)"), ("BC ICMS SPED", "BC ICMS XML", "Diferença BC ICMS (SPED - XML)")],
+        [("Crédito a Maior", "Crédito a Menor"), ("Divergência BC ICMS (a Maior)", "Divergência BC ICMS (a Menor)")], tolerancia)
+
+# ---------- Conciliação item a item (C170 x det), opcional ----------
+# Os itens ficam em colunas (auditor.colunas.Colunas: array('d') para valores, a chave da nota compartilhada entre
+# os seus itens), nunca um objeto por item. Sem o modo item a item, nada disto é lido nem montado.
+ITENS_XML = ["Chave","Item XML","Código XML","BC ICMS XML","Alíquota ICMS XML","Valor ICMS XML","BC IPI XML","Alíquota IPI XML","Valor IPI XML"]
+COLUNAS_ITENS = ["Competência","Chave","Número da nota","Item","Código do item","Item XML","Código XML","CFOP","BC ICMS SPED","BC ICMS XML",
+                 "Alíquota ICMS SPED","Alíquota ICMS XML","Valor ICMS SPED","Valor ICMS XML","BC IPI SPED","BC IPI XML",
+                 "Alíquota IPI SPED","Alíquota IPI XML","Valor IPI SPED","Valor IPI XML","Diferença ICMS (SPED - XML)",
+                 "Diferença IPI (SPED - XML)","Status Auditoria"]
+# (coluna SPED, coluna XML, (texto a maior, texto a menor)), na ordem em que entram no status
+_VALORES_ITEM = [
+    ("Valor ICMS SPED", "Valor ICMS XML", ("Crédito a Maior", "Crédito a Menor")),
+    ("BC ICMS SPED", "BC ICMS XML", ("Divergência BC ICMS (a Maior)", "Divergência BC ICMS (a Menor)")),
+    ("Alíquota ICMS SPED", "Alíquota ICMS XML", ("Divergência Alíquota ICMS (a Maior)", "Divergência Alíquota ICMS (a Menor)")),
+    ("Valor IPI SPED", "Valor IPI XML", ("Divergência IPI (a Maior)", "Divergência IPI (a Menor)")),
+    ("BC IPI SPED", "BC IPI XML", ("Divergência BC IPI (a Maior)", "Divergência BC IPI (a Menor)")),
+    ("Alíquota IPI SPED", "Alíquota IPI XML", ("Divergência Alíquota IPI (a Maior)", "Divergência Alíquota IPI (a Menor)")),
+]
+
+def tabela_itens_xml(xml_map):
+    """Itens de todas as notas de um xml_map lido com tipo 'nfe_itens', em colunas (ITENS_XML).
+
+    Tira 'Itens' de cada nota do xml_map, que fica igual ao da leitura comum (e pode ir para o índice).
+    """
+    cols = Colunas(ITENS_XML, ["Item XML"] + ITENS_XML[3:])
+    for chave, d in xml_map.items():
+        itens = d.pop('Itens', None)
+        if itens and itens[0]: cols.estender([[chave] * len(itens[0]), *itens])
+    return cols.dataframe()
+
+def _posicoes(chaves, campos, xml, coluna, livres=None):
+    # posição em `xml` do item com a mesma (chave, campo), ou -1. Cada item do XML (só os `livres`) serve a um item
+    # do SPED: com (chave, campo) repetido, o k-ésimo do SPED fica com o k-ésimo do XML, na ordem dos itens
+    onde = np.arange(len(xml)) if livres is None else np.flatnonzero(livres)
+    x = xml.iloc[onde]
+    k_xml = x.groupby(["Chave", coluna], sort=False).cumcount().to_numpy()
+    pos = pd.Series(onde, index=pd.MultiIndex.from_arrays([x["Chave"], x[coluna], k_xml]))
+    alvo = pd.DataFrame({"Chave": np.asarray(chaves, dtype=object), "campo": np.asarray(campos)})
+    k = alvo.groupby(["Chave", "campo"], sort=False).cumcount().to_numpy()
+    return pos.reindex(pd.MultiIndex.from_arrays([alvo["Chave"], alvo["campo"], k])).fillna(-1).to_numpy(np.int64)
+
+def conciliar_itens(itens, xml_itens, notas=None, tolerancia=TOLERANCIA):
+    """Cruza os itens C170 (auditor.sped.ler_speds com itens=True) com os det dos XMLs (tabela_itens_xml).
+
+    A junção é pela chave e pelo número do item (nItem); os itens que sobram são procurados pela chave e pelo
+    código (COD_ITEM x cProd). Compara BC, alíquota e valor de ICMS e de IPI. Com `notas` (o resultado de
+    conciliar_nfe), só entram os itens das notas auditadas, e os das notas cujo XML veio do índice (guardado sem
+    os itens) ficam como "XML Só no Índice".
+    """
+    no_indice = None
+    if notas is not None:
+        itens = itens[itens["Chave"].isin(notas[CHAVES['nfe']])]
+        no_indice = notas.loc[notas["XML Encontrado"] == "Sim", CHAVES['nfe']]
+    itens = itens.reset_index(drop=True)
+    pos = _posicoes(itens["Chave"], itens["Item"], xml_itens, "Item XML")
+    falta = pos < 0
+    if falta.any():   # pelo código, só entre os itens do XML que a 1ª passada não usou
+        livres = np.ones(len(xml_itens), dtype=bool); livres[pos[~falta]] = False
+        pos[falta] = _posicoes(itens["Chave"][falta], itens["Código do item"][falta], xml_itens, "Código XML", livres)
+    achado = pos >= 0; pega = np.where(achado, pos, 0)
+    df = itens.copy()
+    for c in ITENS_XML[1:]:
+        v, padrao = xml_itens[c].to_numpy(), "N/A" if c == "Código XML" else 0.0
+        df[c] = np.where(achado, v[pega], padrao) if len(v) else padrao
+    df["Item XML"] = df["Item XML"].astype("Int64").mask(~achado)
+    df["Item"] = df["Item"].astype(np.int64)
+    diffs = [df[sped].to_numpy(np.float64) - df[xml].to_numpy(np.float64) for sped, xml, _ in _VALORES_ITEM]
+    df["Diferença ICMS (SPED - XML)"], df["Diferença IPI (SPED - XML)"] = diffs[0], diffs[3]
+    status = _status(achado, diffs, [n for _, _, n in _VALORES_ITEM], tolerancia)
+    com_itens = itens["Chave"].isin(xml_itens["Chave"]).to_numpy()
+    status[~achado & com_itens] = "Item Não Encontrado no XML"
+    if no_indice is not None: status[~com_itens & itens["Chave"].isin(no_indice).to_numpy()] = "XML Só no Índice"
+    df["Status Auditoria"] = status
+    return df[COLUNAS_ITENS]
@@ -0,0 +1,89 @@
+import io
+import pandas as pd
+
+# ---------- Exportação (memória constante) ----------
+# O .xlsx é escrito linha a linha pelo modo write-only do openpyxl: nada do modelo de objetos da planilha fica
+# em memória, só o lote de linhas corrente. Acima do limite de linhas do Excel, o resultado continua em abas
+# "NF-e (2)", "NF-e (3)"... Para resultados grandes há também CSV (padrão brasileiro: ';' e vírgula decimal) e Parquet.
+MAX_LINHAS_XLSX = 1_048_576     # linhas por planilha no Excel, contando o cabeçalho
+LOTE_EXPORTACAO = 50_000        # linhas convertidas por vez
+FORMATOS = {
+    'xlsx': ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'csv': ("CSV", "text/csv"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet"),
+}
+
+def _lotes(df, lote=LOTE_EXPORTACAO):
+    # linhas como tuplas de valores Python (NaN/NA -> célula vazia), um lote de cada vez
+    for ini in range(0, len(df), lote):
+        parte = df.iloc[ini:ini+lote]
+        cols = [parte[c].astype(object).where(parte[c].notna(), None).tolist() for c in parte.columns]
+        yield zip(*cols)
+
+def _nome_aba(nome, n):
+    sufixo = f" ({n})" if n > 1 else ""
+    return nome[:31 - len(sufixo)] + sufixo   # o Excel aceita até 31 caracteres
+
+def _escrever_abas(wb, df, nome, max_linhas):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+    fino = Side(style="thin")
+    estilo = dict(font=Font(bold=True), border=Border(left=fino, right=fino, top=fino, bottom=fino),
+                  alignment=Alignment(horizontal="center", vertical="top"))   # mesmo cabeçalho do pandas.to_excel
+    ws, n, cheias = None, 0, max_linhas
+    for linhas in _lotes(df):
+        for linha in linhas:
+            if cheias >= max_linhas:
+                n += 1; ws = wb.create_sheet(_nome_aba(nome, n)); cheias = 1
+                cab = []
+                for c in df.columns:
+                    cel = WriteOnlyCell(ws, value=c)
+                    for k, v in estilo.items(): setattr(cel, k, v)
+                    cab.append(cel)
+                ws.append(cab)
+            ws.append(linha); cheias += 1
+    if ws is None:   # resultado vazio: só o cabeçalho
+        ws = wb.create_sheet(_nome_aba(nome, 1)); ws.append(list(df.columns))
+
+def escrever_excel(df, avisos, nome_aba, destino=None, max_linhas=MAX_LINHAS_XLSX, metricas=None, itens=None):
+    """Grava o resultado (e as abas "Itens", "Avisos" e "Métricas", se houver) num .xlsx sem montar a planilha em memória.
+
+    `destino` é um caminho ou arquivo binário; sem ele, devolve um BytesIO posicionado no início. A aba "Métricas"
+    (de auditor.metricas.Metricas) traz as etapas medidas até aqui, sem a própria exportação. `itens` é o
+    resultado da conciliação item a item (auditor.conciliacao.conciliar_itens).
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    _escrever_abas(wb, df, nome_aba, max_linhas)
+    if itens is not None: _escrever_abas(wb, itens, "Itens", max_linhas)
+    if avisos: _escrever_abas(wb, pd.DataFrame({"Avisos": avisos}), "Avisos", max_linhas)
+    if metricas is not None: _escrever_abas(wb, metricas.dataframe(), "Métricas", max_linhas)
+    saida = destino if destino is not None else io.BytesIO()
+    wb.save(saida)
+    if destino is None: saida.seek(0)
+    return saida
+
+def montar_excel(df, avisos, nome_aba):
+    """.xlsx do resultado num BytesIO (mesma assinatura da antiga função do app)."""
+    return escrever_excel(df, avisos, nome_aba)
+
+def escrever_csv(df, destino=None):
+    """CSV com ';' e vírgula decimal (abre direto no Excel em português), gravado em lotes."""
+    saida = destino if destino is not None else io.BytesIO()
+    df.to_csv(saida, index=False, sep=";", decimal=",", encoding="utf-8-sig", chunksize=LOTE_EXPORTACAO)
+    if destino is None: saida.seek(0)
+    return saida
+
+def escrever_parquet(df, destino=None):
+    """Parquet (precisa de pyarrow); mantém os tipos das colunas e é o formato mais compacto."""
+    saida = destino if destino is not None else io.BytesIO()
+    df.to_parquet(saida, index=False)
+    if destino is None: saida.seek(0)
+    return saida
+
+def exportar(df, avisos, formato, nome_aba, destino=None, metricas=None, itens=None):
+    """Grava `df` no formato pedido ('xlsx', 'csv' ou 'parquet'); itens, avisos e métricas só vão no .xlsx (abas à parte)."""
+    if formato == 'xlsx': return escrever_excel(df, avisos, nome_aba, destino, metricas=metricas, itens=itens)
+    if formato == 'csv': return escrever_csv(df, destino)
+    if formato == 'parquet': return escrever_parquet(df, destino)
+    raise ValueError(f"Formato de exportação desconhecido: {formato}")
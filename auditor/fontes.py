@@ -0,0 +1,62 @@
+import io, os
+
+# ---------- Fontes de dados (caminho, bytes ou upload em memória) ----------
+# Uma "fonte" é um caminho, um objeto bytes-like (bytes/bytearray/memoryview), um BytesIO
+# (inclusive o UploadedFile do Streamlit) ou uma tupla (nome, fonte). Tudo é lido direto do
+# buffer original, sem arquivo temporário e sem copiar o conteúdo.
+
+class _LeitorMemoria(io.RawIOBase):
+    def __init__(self, buf):
+        self.buf, self.pos = memoryview(buf).cast('B'), 0
+    def readable(self): return True
+    def seekable(self): return True
+    def readinto(self, b):
+        n = min(len(b), len(self.buf) - self.pos)
+        b[:n] = self.buf[self.pos:self.pos+n]; self.pos += n
+        return n
+    def seek(self, pos, whence=0):
+        self.pos = max(0, (0, self.pos, len(self.buf))[whence] + pos); return self.pos
+    def tell(self): return self.pos
+    def close(self):
+        if not self.closed: self.buf.release()
+        super().close()
+
+def nome_fonte(fonte, padrao="arquivo"):
+    if isinstance(fonte, tuple): return fonte[0]
+    if isinstance(fonte, (str, os.PathLike)): return os.path.basename(fonte)
+    return getattr(fonte, 'name', None) or padrao
+
+def conteudo_fonte(fonte):
+    return fonte[1] if isinstance(fonte, tuple) else fonte
+
+def memoria(fonte):
+    """Buffer (memoryview) da fonte em memória, ou None se a fonte for um caminho."""
+    fonte = conteudo_fonte(fonte)
+    if isinstance(fonte, (bytes, bytearray, memoryview)): return memoryview(fonte)
+    if hasattr(fonte, 'getbuffer'): return fonte.getbuffer()
+    if hasattr(fonte, 'read'):  # outro file-like: única situação em que o conteúdo é copiado
+        fonte.seek(0); return memoryview(fonte.read())
+    return None
+
+def transportavel(fonte, nome):
+    # memoryview/BytesIO não passam pelo pickle de um pool de processos: vão como (nome, bytes)
+    if isinstance(conteudo_fonte(fonte), (str, os.PathLike, bytes)): return fonte
+    with memoria(fonte) as mem: return (nome, mem.tobytes())
+
+def tamanho_fonte(fonte):
+    mem = memoria(fonte)
+    if mem is not None:
+        with mem: return mem.nbytes
+    try:
+        return os.path.getsize(conteudo_fonte(fonte))
+    except (OSError, TypeError):
+        return None
+
+def abrir_binario(fonte):
+    mem = memoria(fonte)
+    if mem is None: return open(conteudo_fonte(fonte), 'rb')
+    return io.BufferedReader(_LeitorMemoria(mem), buffer_size=1 << 20)
+
+def abrir_texto(fonte, enc):
+    # mesmo comportamento de open(path, 'r', encoding=enc, errors='ignore')
+    return io.TextIOWrapper(abrir_binario(fonte), encoding=enc, errors='ignore')
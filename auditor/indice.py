@@ -0,0 +1,76 @@
+import sqlite3, json, os, time
+from auditor.cache import versao_extrator
+
+# ---------- Índice permanente de XMLs por chave ----------
+# Diferente do cache (auditor/cache.py, por conteúdo de arquivo), o índice guarda o resultado de cada XML pela
+# chave de acesso e sobrevive entre sessões: uma nota de março cujo XML veio no lote de janeiro é achada aqui.
+CAMINHO_PADRAO = os.environ.get("AUDITOR_INDICE", os.path.join(os.path.expanduser("~"), ".cache", "auditor_sped", "xml_indice.sqlite3"))
+_LOTE_SQL = 500                     # chaves por consulta IN (...); acima disso a busca usa tabela temporária
+
+class IndiceXML:
+    """Índice SQLite {(tipo, chave): dict extraído do XML}; o XML mais recente de uma chave substitui o anterior."""
+
+    def __init__(self, caminho=CAMINHO_PADRAO):
+        self.caminho, self.versao = caminho, versao_extrator()
+        self.gravadas = self.encontradas = 0
+        if caminho != ":memory:": os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self.con = sqlite3.connect(caminho, timeout=30)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute("""CREATE TABLE IF NOT EXISTS xml_indice (
+            tipo TEXT NOT NULL, chave TEXT NOT NULL, dados TEXT NOT NULL, versao TEXT NOT NULL,
+            atualizado REAL NOT NULL, PRIMARY KEY (tipo, chave)) WITHOUT ROWID""")
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS busca (chave TEXT PRIMARY KEY) WITHOUT ROWID")
+        with self.con:   # como no cache (número + hash de xmls.py): o que outra versão dos parsers extraiu sai das auditorias
+            self.con.execute("DELETE FROM xml_indice WHERE versao <> ?", (self.versao,))
+
+    def adicionar(self, tipo, xml_map):
+        """Grava (ou atualiza) as chaves de um xml_map de processar_xmls; devolve quantas foram gravadas."""
+        agora = time.time()
+        linhas = [(tipo, chave, json.dumps(d, ensure_ascii=False), self.versao, agora)
+                  for chave, d in xml_map.items() if chave]
+        with self.con:   # chave já gravada com os mesmos dados não é tocada: a geração (abaixo) só muda se algo mudar
+            self.con.executemany("""INSERT INTO xml_indice VALUES (?,?,?,?,?) ON CONFLICT (tipo, chave) DO UPDATE
+                SET dados = excluded.dados, versao = excluded.versao, atualizado = excluded.atualizado
+                WHERE dados <> excluded.dados OR versao <> excluded.versao""", linhas)
+        self.gravadas += len(linhas)
+        return len(linhas)
+
+    def buscar(self, tipo, chaves):
+        """Devolve {chave: dict} para as chaves presentes no índice, numa única consulta por lote."""
+        chaves = list(dict.fromkeys(c for c in chaves if c))
+        if len(chaves) <= _LOTE_SQL:
+            sql = f"SELECT chave, dados FROM xml_indice WHERE tipo = ? AND chave IN ({','.join('?'*len(chaves))})"
+            return {c: json.loads(d) for c, d in self.con.execute(sql, [tipo, *chaves])} if chaves else {}
+        # muitas chaves: junta com uma tabela temporária em vez de milhares de IN (...)
+        with self.con:
+            self.con.execute("DELETE FROM busca")
+            self.con.executemany("INSERT INTO busca VALUES (?)", ((c,) for c in sorted(chaves)))
+        sql = "SELECT i.chave, i.dados FROM busca b JOIN xml_indice i ON i.tipo = ? AND i.chave = b.chave"
+        return {c: json.loads(d) for c, d in self.con.execute(sql, (tipo,))}
+
+    def completar(self, tipo, xml_map, chaves):
+        """xml_map acrescido das `chaves` que não estão nele mas estão no índice (o xml_map tem prioridade)."""
+        faltam = [c for c in dict.fromkeys(chaves) if c and c not in xml_map]
+        achados = self.buscar(tipo, faltam) if faltam else {}
+        self.encontradas += len(achados)
+        return {**achados, **xml_map} if achados else xml_map
+
+    def geracao(self, tipo):
+        """Muda sempre que as chaves de `tipo` no índice mudam (gravação, limpeza, versão): entra na chave dos resultados."""
+        return tuple(self.con.execute("SELECT COUNT(*), MAX(atualizado) FROM xml_indice WHERE tipo = ?", (tipo,)).fetchone())
+
+    def contar(self, tipo=None):
+        if tipo is None: return self.con.execute("SELECT COUNT(*) FROM xml_indice").fetchone()[0]
+        return self.con.execute("SELECT COUNT(*) FROM xml_indice WHERE tipo = ?", (tipo,)).fetchone()[0]
+
+    def limpar(self, tipo=None):
+        with self.con:
+            if tipo is None: self.con.execute("DELETE FROM xml_indice")
+            else: self.con.execute("DELETE FROM xml_indice WHERE tipo = ?", (tipo,))
+
+    def fechar(self):
+        self.con.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.fechar()
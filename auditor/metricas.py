@@ -0,0 +1,118 @@
+import heapq, json, logging, time
+from contextlib import contextmanager, nullcontext
+
+# ---------- Métricas por etapa ----------
+# Tempo, itens/s, bytes e pico de memória de cada etapa da auditoria, mais os arquivos que se destacam (XMLs mais
+# lentos, maiores SPEDs). Todo o fluxo recebe `metricas=None` por padrão: desligadas, custam um `if` por etapa.
+# O pico de memória é o do processo principal (no Linux, zerado no início de cada etapa); os processos do pool
+# de leitura não entram na conta.
+LOGGER = logging.getLogger("auditor.metricas")
+N_DESTAQUES = 5
+DESTAQUES = {'xml': ("XML mais lento", 'segundos'), 'sped': ("Maior SPED", 'bytes')}
+COLUNAS = ["Tipo", "Nome", "Segundos", "Itens", "Itens/s", "MB", "MB/s", "Pico de memória (MB)"]
+_NADA = nullcontext({})
+
+def zerar_pico():
+    """Zera o pico de RSS do processo (VmHWM); False onde não há /proc/self/clear_refs."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5")
+        return True
+    except OSError:
+        return False
+
+def pico_mb():
+    """Pico de RSS do processo em MB: desde o último zerar_pico() no Linux, desde o início nos demais Unix;
+    None onde não há como medir (Windows)."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"): return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    try: import resource
+    except ImportError: return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # Linux: KB (no macOS vem em bytes)
+
+def etapa(metricas, nome, itens=0, bytes_=0):
+    """metricas.etapa(...) ou, com metricas=None, um contexto que não faz nada."""
+    return _NADA if metricas is None else metricas.etapa(nome, itens, bytes_)
+
+class Metricas:
+    """Etapas (na ordem em que rodaram; repetir o nome substitui a anterior) e destaques por arquivo."""
+
+    def __init__(self, fluxo=""):
+        self.fluxo = fluxo
+        self.etapas = {}
+        self._destaques = {c: [] for c in DESTAQUES}
+        self._n = 0
+
+    @contextmanager
+    def etapa(self, nome, itens=0, bytes_=0):
+        """Mede o bloco `with`. O dict devolvido aceita itens/bytes descobertos durante a etapa e "descontar",
+        segundos já medidos à parte (ex.: a abertura dos ZIPs dentro da leitura dos XMLs)."""
+        reg = {"itens": itens, "bytes": bytes_, "descontar": 0.0}
+        self.registrar(nome, None, itens, bytes_)   # a etapa fica na posição em que começou (None: em andamento)
+        zerar_pico(); inicio = time.perf_counter()
+        try:
+            yield reg
+        finally:
+            self.etapas[nome].update(segundos=time.perf_counter() - inicio - reg["descontar"], itens=reg["itens"],
+                                     bytes=reg["bytes"], pico_mb=pico_mb())
+
+    def registrar(self, nome, segundos, itens=0, bytes_=0, pico=None):
+        self.etapas.pop(nome, None)
+        self.etapas[nome] = {"segundos": segundos, "itens": itens, "bytes": bytes_, "pico_mb": pico}
+
+    def arquivo(self, categoria, nome, segundos, bytes_, itens=None):
+        """Um arquivo lido; só os N_DESTAQUES maiores (em tempo ou tamanho, ver DESTAQUES) ficam guardados."""
+        reg = {"nome": nome, "segundos": segundos, "bytes": bytes_ or 0, "itens": itens}
+        h = self._destaques[categoria]; self._n += 1
+        item = (reg[DESTAQUES[categoria][1]], self._n, reg)
+        if len(h) < N_DESTAQUES: heapq.heappush(h, item)
+        elif item[0] > h[0][0]: heapq.heapreplace(h, item)
+
+    def destaques(self, categoria):
+        return [r for _, _, r in sorted(self._destaques[categoria], key=lambda x: (-x[0], x[1]))]
+
+    def linhas(self):
+        """Dicts com COLUNAS: uma linha por etapa e depois os destaques."""
+        def linha(tipo, nome, r, pico=None):
+            s, mb = r["segundos"], r["bytes"] / 1e6
+            return {"Tipo": tipo, "Nome": nome, "Segundos": round(s, 3), "Itens": r["itens"],
+                    "Itens/s": round(r["itens"] / s, 1) if r["itens"] and s else None, "MB": round(mb, 3) if mb else None,
+                    "MB/s": round(mb / s, 1) if mb and s else None, "Pico de memória (MB)": round(pico) if pico else None}
+        saida = [linha("Etapa", nome, r, r["pico_mb"]) for nome, r in self.etapas.items() if r["segundos"] is not None]
+        for categoria, (rotulo, _) in DESTAQUES.items():
+            saida += [linha(rotulo, r["nome"], r) for r in self.destaques(categoria)]
+        return saida
+
+    def dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.linhas(), columns=COLUNAS).astype({"Itens": "Int64", "Pico de memória (MB)": "Int64"})
+
+    def json(self):
+        return {"fluxo": self.fluxo, "etapas": [{"etapa": n, **r} for n, r in self.etapas.items() if r["segundos"] is not None],
+                "destaques": {c: self.destaques(c) for c in DESTAQUES}}
+
+    def log(self, logger=LOGGER, nivel=logging.INFO, etapas=None):
+        """Uma linha JSON por etapa e por destaque (campo "evento"), para ferramentas de monitoramento.
+        Com `etapas`, só essas etapas (e nenhum destaque): para registrar o que foi medido depois."""
+        if not logger.isEnabledFor(nivel): return
+        for n, r in self.etapas.items():
+            if r["segundos"] is None or (etapas is not None and n not in etapas): continue
+            logger.log(nivel, json.dumps({"evento": "etapa", "fluxo": self.fluxo, "etapa": n, **r}, ensure_ascii=False))
+        if etapas is not None: return
+        for c in DESTAQUES:
+            for r in self.destaques(c):
+                logger.log(nivel, json.dumps({"evento": "destaque", "fluxo": self.fluxo, "categoria": c, **r}, ensure_ascii=False))
+
+def contar(fontes, reg):
+    """Repassa `fontes`, somando em reg["segundos"] o tempo gasto para produzi-las (ex.: abrir ZIPs) e em
+    reg["itens"]/reg["bytes"] quantas e de que tamanho passaram."""
+    from auditor.fontes import tamanho_fonte
+    it, fim = iter(fontes), object()
+    while True:
+        t = time.perf_counter(); f = next(it, fim); reg["segundos"] += time.perf_counter() - t
+        if f is fim: return
+        reg["itens"] += 1; reg["bytes"] += tamanho_fonte(f) or 0
+        yield f
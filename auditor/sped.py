@@ -0,0 +1,351 @@
+import re, os, time, codecs, queue, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from auditor.fontes import abrir_binario, nome_fonte, tamanho_fonte, transportavel
+from auditor.codificacao import codificacao_bytes, lembrada, lembrar, PADRAO_SPED
+import pandas as pd
+from auditor.colunas import Colunas, num
+from auditor.conciliacao import CFOP_ENTRADA, CHAVES, conciliar_nfe, conciliar_cte
+
+# ---------- Leitor SPED (passada única, em bytes) ----------
+TAMANHO_BLOCO = 16 * 1024 * 1024
+LINHAS_0000 = 20    # o 0000 só vale nas primeiras linhas
+
+def _padrao(registros):
+    # casa só as linhas cujo código de registro interessa (o '\n' inicial deixa o regex buscar o
+    # prefixo literal em C), inclusive as truncadas logo após o código; o resto do arquivo nem vira str
+    codigos = b'|'.join(re.escape(r.encode('ascii')) for r in sorted(registros))
+    return re.compile(rb'\n\|(' + codigos + rb')(?=[|\r\n]|$)[^\n]*')
+
+def ler_sped(fonte, consumidores, enc=None, bloco=TAMANHO_BLOCO, progresso=None):
+    """Lê o SPED uma única vez, em blocos binários, e entrega cada registro aos consumidores que o tratam.
+
+    Cada consumidor declara `registros` ({'C100': -1, 'C170': 12}: código -> maxsplit dos campos) e recebe
+    `registro(reg, campos, linha)`; só essas linhas são decodificadas e quebradas. Sem `enc`, a codificação é
+    decidida no primeiro bloco que não for só ASCII (auditor.codificacao). Se um consumidor levantar exceção,
+    ele recebe `erro(e)` e sai da leitura, sem afetar os demais. `progresso(bytes_lidos)` é chamado a cada
+    bloco. Devolve a competência ('mm/aaaa') do 0000 ou None.
+    """
+    enc = enc or lembrada(fonte); decidida = enc is not None
+    tratadores, cortes = {b'0000': []}, {b'0000': -1}
+    for c in consumidores:
+        for r, n in c.registros.items():
+            r = r.encode('ascii'); tratadores.setdefault(r, []).append(c)
+            cortes[r] = -1 if n < 0 or cortes.get(r, 0) < 0 else max(n, cortes.get(r, 0))
+    padrao = _padrao(r.decode('ascii') for r in tratadores)
+    ativos = set(consumidores)
+    comp, linha, resto, so_cr, lidos = None, 0, b'\n', None, 0
+    with abrir_binario(fonte) as f:
+        if f.peek(3)[:3] == codecs.BOM_UTF8: lidos = len(f.read(3)); enc = enc or 'utf-8'
+        while ativos or (comp is None and linha <= LINHAS_0000):
+            dados = f.read(bloco); lidos += len(dados)
+            if so_cr is None:   # fim de linha só CR? decidido no 1º bloco que tiver '\r' ou '\n'
+                # um '\r' no último byte pode ser metade de um CRLF: só decide com ele no fim do arquivo
+                if b'\n' in dados: so_cr = False
+                elif b'\r' in dados[:-1] or (not dados and b'\r' in resto): so_cr = True
+                if so_cr: resto = resto.replace(b'\r', b'\n')   # o que veio antes, ainda sem fim de linha
+            if so_cr: dados = dados.replace(b'\r', b'\n')
+            buf = resto + dados
+            corte = buf.rfind(b'\n') if dados else len(buf)
+            if enc is None: enc = codificacao_bytes(buf)   # enquanto for só ASCII, qualquer uma decodifica igual
+            dec, pos = enc or PADRAO_SPED, 0
+            for m in padrao.finditer(buf, 0, corte):
+                ini = m.start() + 1
+                linha += buf.count(b'\n', pos, ini); pos = ini
+                reg = m.group(1)
+                campos = buf[ini:m.end()].decode(dec, 'ignore').strip().split('|', cortes[reg])
+                if reg == b'0000':
+                    if comp is None and linha <= LINHAS_0000 and len(campos) > 4 and len(campos[4]) == 8:
+                        comp = f"{campos[4][2:4]}/{campos[4][4:8]}"
+                for c in tuple(tratadores[reg]):   # cópia: quem falhar sai da lista no meio do laço
+                    if c not in ativos: continue
+                    try: c.registro(campos[1], campos, linha)
+                    except Exception as e:
+                        c.erro(e); ativos.discard(c)
+                        for lst in tratadores.values():
+                            if c in lst: lst.remove(c)
+            linha += buf.count(b'\n', pos, corte)
+            resto = buf[corte:]
+            if progresso is not None: progresso(lidos)
+            if not dados: break
+    if not decidida and (enc or not dados): lembrar(fonte, enc or PADRAO_SPED)
+    for c in ativos:
+        try: c.fim()
+        except Exception as e: c.erro(e)
+    return comp
+
+def processar_sped(sped, consumidores, nome=None, progresso=None):
+    # roda a leitura e aplica a competência / avisos comuns a todos os consumidores
+    nome = nome or nome_fonte(sped)
+    try:
+        comp = ler_sped(sped, consumidores, progresso=progresso)
+    except Exception as e:
+        for c in consumidores: c.erro(e)
+        comp = None
+    for c in consumidores:
+        if comp is None: c.warns.insert(0, f"Aviso: Competência não encontrada em {nome}.")
+        c.competencia = comp
+        c.cols.marcar("Competência", comp or "Desconhecida")
+    return consumidores
+
+# ---------- Notas do SPED (a conciliação com os XMLs fica em auditor.conciliacao) ----------
+NOTAS_NFE = ["Competência","Série da nota","Número da nota","Chave","Data de emissão","Valor Total SPED","BC ICMS SPED","Valor ICMS SPED","Valor IPI SPED","CFOP","Entrada"]
+NOTAS_CTE = ["Competência","Série CT-e","Número CT-e","Chave CT-e","Data de Emissão SPED","Valor Total Prestação SPED","BC ICMS SPED","Valor ICMS SPED","CFOPs SPED","Alíquotas ICMS SPED","Entrada"]
+
+def colunas_nfe(): return Colunas(NOTAS_NFE, NOTAS_NFE[5:9], por_arquivo=("Competência",))
+def colunas_cte(): return Colunas(NOTAS_CTE, NOTAS_CTE[5:8], por_arquivo=("Competência",))
+
+def _entrada(cfops):
+    return any(c.startswith(CFOP_ENTRADA) for c in cfops)
+
+class ConsumidorNFe:
+    registros = {'C100': -1, 'C170': 12}   # do C170 só interessa o CFOP (campo 11)
+
+    def __init__(self, nome, cols=None):
+        self.nome = nome
+        self.cols = cols if cols is not None else colunas_nfe()
+        self.warns = []
+        self.current, self.cfops = None, set()
+
+    def registro(self, t, fields, line_num):
+        if t=="C100":
+            self._fechar()
+            try:
+                # série, número, chave, data, valor total, BC ICMS, ICMS, IPI
+                self.current = (fields[7].strip(), fields[8].strip(), fields[9].strip(), fields[10].strip(),
+                                fields[12].replace(",",".").strip(), fields[21].replace(",",".").strip(),
+                                fields[22].replace(",",".").strip(), fields[25].replace(",",".").strip())
+            except IndexError:
+                self.warns.append(f"Aviso: C100 malformado em {self.nome} linha {line_num}.")
+                self.current=None
+            self.cfops=set()
+        elif t=="C170" and self.current is not None and len(fields)>11:
+            cf = fields[11].strip()
+            if cf: self.cfops.add(cf)
+
+    def fim(self):
+        self._fechar()
+
+    def erro(self, e):
+        self.warns.append(f"Erro inesperado em {self.nome}: {e}")
+
+    def _fechar(self):
+        if self.current is None: return
+        serie, numero, chave, data, vl_doc, vl_bc, vl_icms, vl_ipi = self.current
+        self.current, cfops = None, self.cfops
+        # ICMS/IPI ilegíveis interrompem o arquivo com "Erro inesperado", como sempre foi
+        icms = float(vl_icms) if vl_icms else 0.0
+        ipi  = float(vl_ipi)  if vl_ipi  else 0.0
+        self.cols.adicionar((serie, numero, chave, data, num(vl_doc), num(vl_bc), icms, ipi,
+                             ", ".join(sorted(cfops)) if cfops else "", _entrada(cfops)))
+
+class ConsumidorCTe:
+    registros = {'D100': -1, 'D190': 5}
+
+    def __init__(self, nome, cols=None):
+        self.nome = nome
+        self.cols = cols if cols is not None else colunas_cte()
+        self.warns = []
+        self.current, self.cfops, self.aliquotas = None, set(), set()
+
+    def registro(self, t, fields, line_num):
+        if t=="D100":
+            self._fechar()
+            try:
+                # série, número, chave, data, valor da prestação, BC ICMS, ICMS
+                self.current = (fields[7].strip(), fields[9].strip(), fields[10].strip(), fields[11].strip(),
+                                fields[13].replace(",",".").strip(), fields[19].replace(",",".").strip(),
+                                fields[20].replace(",",".").strip())
+            except IndexError:
+                self.warns.append(f"Aviso: D100 malformado em {self.nome} linha {line_num}.")
+                self.current=None
+            self.cfops, self.aliquotas = set(), set()
+        elif t=="D190" and self.current is not None and len(fields)>4:
+            if fields[3].strip(): self.cfops.add(fields[3].strip())
+            if fields[4].strip(): self.aliquotas.add(fields[4].strip())
+
+    def fim(self):
+        self._fechar()
+
+    def erro(self, e):
+        self.warns.append(f"Erro inesperado em {self.nome}: {e}")
+
+    def _fechar(self):
+        if self.current is None: return
+        serie, numero, chave, data, vl_prest, vl_bc, vl_icms = self.current
+        self.current, cfops, aliquotas = None, self.cfops, self.aliquotas
+        bc=float(vl_bc) if vl_bc else 0.0
+        icms=float(vl_icms) if vl_icms else 0.0
+        self.cols.adicionar((serie, numero, chave, data, num(vl_prest), bc, icms, ", ".join(sorted(cfops)) if cfops else "",
+                             ", ".join(sorted(aliquotas)) if aliquotas else "", _entrada(cfops)))
+
+# ---------- Itens do SPED (C170), só na conciliação item a item ----------
+ITENS_NFE = ["Competência","Chave","Número da nota","Item","Código do item","CFOP","BC ICMS SPED","Alíquota ICMS SPED",
+             "Valor ICMS SPED","BC IPI SPED","Alíquota IPI SPED","Valor IPI SPED"]
+
+def colunas_itens(): return Colunas(ITENS_NFE, ["Item"] + ITENS_NFE[6:], por_arquivo=("Competência",))
+
+class ConsumidorItens:
+    # roda junto com o ConsumidorNFe na mesma leitura; a chave de cada C170 é a do C100 que o precede
+    registros = {'C100': 10, 'C170': 25}
+
+    def __init__(self, nome, cols=None):
+        self.nome = nome
+        self.cols = cols if cols is not None else colunas_itens()
+        self.warns = []
+        self.nota = None
+
+    def registro(self, t, fields, line_num):
+        if t=="C100":
+            self.nota = (fields[9].strip(), fields[8].strip()) if len(fields) > 9 and fields[9].strip() else None
+        elif self.nota is not None:
+            if len(fields) < 25:
+                self.warns.append(f"Aviso: C170 malformado em {self.nome} linha {line_num}."); return
+            v = lambda i: num(fields[i].replace(",", ".").strip())
+            # item, código, CFOP; ICMS: BC, alíquota, valor; IPI: BC, alíquota, valor
+            self.cols.adicionar((*self.nota, v(2), fields[3].strip(), fields[11].strip(),
+                                 v(13), v(14), v(15), v(22), v(23), v(24)))
+
+    def fim(self): pass
+
+    def erro(self, e):
+        self.warns.append(f"Erro inesperado nos itens de {self.nome}: {e}")
+
+def ler_notas_nfe(sped, nome=None, cols=None):
+    """Lê os C100/C170 de um SPED para `cols` (padrão: novo buffer); devolve (Colunas, avisos)."""
+    c, = processar_sped(sped, [ConsumidorNFe(nome or nome_fonte(sped), cols)], nome)
+    return c.cols, c.warns
+
+def ler_notas_cte(sped, nome=None, cols=None):
+    """Lê os D100/D190 de um SPED para `cols` (padrão: novo buffer); devolve (Colunas, avisos)."""
+    c, = processar_sped(sped, [ConsumidorCTe(nome or nome_fonte(sped), cols)], nome)
+    return c.cols, c.warns
+
+# ---------- Processadores (mesma regra do seu script) ----------
+def _conciliar(tipo, notas, xml_map, indice, opcoes):
+    # com índice (auditor.indice.IndiceXML), as chaves sem XML no xml_map são buscadas nele de uma vez
+    if indice is not None: xml_map = indice.completar(tipo, xml_map, notas[CHAVES[tipo]])
+    return (conciliar_nfe if tipo == 'nfe' else conciliar_cte)(notas, xml_map, **opcoes)
+
+def processar_sped_nfe(sped, xml_map, nome=None, indice=None, **opcoes):
+    """Audita as NF-e de um SPED contra os XMLs; devolve (DataFrame, avisos). `opcoes` vão para conciliar_nfe."""
+    notas, warns = ler_notas_nfe(sped, nome)
+    return _conciliar('nfe', notas.dataframe(), xml_map, indice, opcoes), warns
+
+def processar_sped_cte(sped, xml_map, nome=None, indice=None, **opcoes):
+    """Audita os CT-e de um SPED contra os XMLs; devolve (DataFrame, avisos). `opcoes` vão para conciliar_cte."""
+    notas, warns = ler_notas_cte(sped, nome)
+    return _conciliar('cte', notas.dataframe(), xml_map, indice, opcoes), warns
+
+def auditar_sped(sped, xml_map_nfe=None, xml_map_cte=None, nome=None, indice=None):
+    """NF-e e CT-e do mesmo SPED numa única leitura; devolve {'nfe': (DataFrame, avisos), 'cte': (DataFrame, avisos)}."""
+    nome = nome or nome_fonte(sped); cons, maps = {}, {}
+    if xml_map_nfe is not None: cons['nfe'], maps['nfe'] = ConsumidorNFe(nome), xml_map_nfe
+    if xml_map_cte is not None: cons['cte'], maps['cte'] = ConsumidorCTe(nome), xml_map_cte
+    processar_sped(sped, list(cons.values()), nome)
+    return {k: (_conciliar(k, c.cols.dataframe(), maps[k], indice, {}), c.warns) for k, c in cons.items()}
+
+# ---------- Vários SPEDs em paralelo ----------
+CONSUMIDORES = {'nfe': ConsumidorNFe, 'cte': ConsumidorCTe}
+INTERVALO_PROGRESSO = 0.25   # segundos entre atualizações do callback de progresso
+
+def chave_competencia(comp):
+    # 'mm/aaaa' -> ordenável por ano e mês; sem competência vai para o fim
+    try: return (0, int(comp[3:]), int(comp[:2]))
+    except (TypeError, ValueError): return (1, 0, 0)
+
+def _ler_arquivo(tipo, i, fonte, nome, avisar=None, itens=False):
+    # devolve (competência, notas, avisos, segundos, segundos só na montagem do DataFrame, itens C170 ou None)
+    c = CONSUMIDORES[tipo](nome); inicio = time.perf_counter()
+    ci = ConsumidorItens(nome) if itens else None
+    passo = (lambda lidos: avisar((i, lidos, len(c.cols), time.perf_counter() - inicio))) if avisar else None
+    processar_sped(fonte, [c, ci] if ci else [c], nome, progresso=passo)
+    meio = time.perf_counter(); df = c.cols.dataframe()
+    warns = c.warns
+    if ci is not None:   # a competência não encontrada vem nos dois consumidores
+        df_itens, vistos = ci.cols.dataframe(), set(c.warns); warns = warns + [w for w in ci.warns if w not in vistos]
+    fim = time.perf_counter()
+    return c.competencia, df, warns, fim - inicio, fim - meio, df_itens if ci is not None else None
+
+def ler_speds(fontes, tipo='nfe', workers=None, progresso=None, metricas=None, itens=False):
+    """Lê vários SPEDs ao mesmo tempo (um processo por arquivo); devolve (notas, avisos) em ordem de competência.
+
+    Os processos só leem as notas: o cruzamento com os XMLs (auditor.conciliacao) roda depois, uma vez, sobre o
+    resultado, e o xml_map nunca sai do processo principal. `progresso(estados)` recebe a lista de dicts por
+    arquivo (nome, estado, lidos, tamanho, notas, segundos), a cada INTERVALO_PROGRESSO. Com `metricas`
+    (auditor.metricas.Metricas), cada arquivo entra nos destaques e a montagem das tabelas vira uma etapa à parte.
+    Com `itens` (só NF-e), a mesma leitura guarda os C170 e devolve (notas, avisos, itens).
+    """
+    if itens and tipo != 'nfe': raise ValueError("A conciliação item a item só existe para NF-e.")
+    fontes = list(fontes)
+    estados = [{"nome": nome_fonte(f, f"sped #{i+1}"), "estado": "na fila", "lidos": 0, "tamanho": tamanho_fonte(f) or 0,
+                "notas": 0, "segundos": 0.0} for i, f in enumerate(fontes)]
+    resultados, ultimo = [None] * len(fontes), [0.0]
+
+    def atualizar(i, **campos):
+        estados[i].update(campos)
+        if progresso and (campos["estado"] == "concluído" or time.perf_counter() - ultimo[0] >= INTERVALO_PROGRESSO):
+            ultimo[0] = time.perf_counter(); progresso(estados)
+
+    def avisar(msg):
+        i, lidos, notas, segundos = msg
+        if resultados[i] is None: atualizar(i, estado="lendo", lidos=lidos, notas=notas, segundos=segundos)
+
+    def concluir(i, res):
+        resultados[i] = res
+        atualizar(i, estado="concluído", lidos=estados[i]["tamanho"] or estados[i]["lidos"], notas=len(res[1]), segundos=res[3])
+
+    workers = min(workers or os.cpu_count() or 1, len(fontes))
+    ex = gerente = None
+    if workers > 1:
+        try:
+            ex = ProcessPoolExecutor(max_workers=workers); gerente = multiprocessing.Manager()
+        except (OSError, NotImplementedError):
+            if ex is not None: ex.shutdown()
+            ex = None  # sem pool disponível (ex.: sandbox sem fork) -> segue serial
+    try:
+        if ex is None:
+            for i, f in enumerate(fontes): concluir(i, _ler_arquivo(tipo, i, f, estados[i]["nome"], avisar, itens))
+        else:
+            fila, futuros, proximos = gerente.Queue(), {}, iter(range(len(fontes)))
+
+            def enviar():
+                # no máximo `workers` arquivos no pool: cada SPED só vira bytes (transportavel) quando vai ser lido
+                for i in proximos:
+                    try:
+                        fut = ex.submit(_ler_arquivo, tipo, i, transportavel(fontes[i], estados[i]["nome"]), estados[i]["nome"], fila.put, itens)
+                        futuros[fut] = i; return fut
+                    except (BrokenProcessPool, RuntimeError):   # pool caiu: lê este arquivo aqui mesmo
+                        concluir(i, _ler_arquivo(tipo, i, fontes[i], estados[i]["nome"], avisar, itens))
+                return None
+
+            pendentes = {f for f in (enviar() for _ in range(workers)) if f is not None}
+            while pendentes:
+                feitos, pendentes = wait(pendentes, timeout=INTERVALO_PROGRESSO, return_when=FIRST_COMPLETED)
+                while True:
+                    try: avisar(fila.get_nowait())
+                    except queue.Empty: break
+                for fut in feitos:
+                    i = futuros.pop(fut)
+                    try: res = fut.result()
+                    except Exception:  # pool caiu: lê este arquivo aqui mesmo
+                        res = _ler_arquivo(tipo, i, fontes[i], estados[i]["nome"], avisar, itens)
+                    concluir(i, res)
+                    novo = enviar()
+                    if novo is not None: pendentes.add(novo)
+    finally:
+        if ex is not None: ex.shutdown(cancel_futures=True)
+        if gerente is not None: gerente.shutdown()
+    ordem = sorted(range(len(fontes)), key=lambda i: (chave_competencia(resultados[i][0]), i))
+    if not ordem:
+        vazio = (colunas_nfe() if tipo == 'nfe' else colunas_cte()).dataframe(), []
+        return vazio + (colunas_itens().dataframe(),) if itens else vazio
+    inicio = time.perf_counter()
+    notas = pd.concat([resultados[i][1] for i in ordem], ignore_index=True)
+    if itens: df_itens = pd.concat([resultados[i][5] for i in ordem], ignore_index=True)
+    if metricas is not None:
+        for e in estados: metricas.arquivo('sped', e["nome"], e["segundos"], e["tamanho"], e["notas"])
+        # com vários processos é a soma do tempo de cada um, não o tempo de relógio
+        metricas.registrar("SPEDs: montagem das tabelas", sum(r[4] for r in resultados) + time.perf_counter() - inicio, len(notas))
+    avisos = [w for i in ordem for w in resultados[i][2]]
+    return (notas, avisos, df_itens) if itens else (notas, avisos)
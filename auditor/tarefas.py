@@ -0,0 +1,96 @@
+import hashlib, threading, time, traceback
+from collections import OrderedDict
+from auditor.fontes import memoria, nome_fonte, conteudo_fonte
+
+# ---------- Tarefas em segundo plano ----------
+# Cada auditoria do app roda numa thread própria, fora do ciclo de execução do Streamlit: um rerun, um download
+# ou a queda da conexão não interrompem nem repetem o trabalho. A tarefa é identificada pela impressão digital do
+# conteúdo enviado e das opções que mudam o resultado; pedir de novo a mesma chave devolve a tarefa em andamento
+# ou o resultado pronto, guardado até LIMITE_RESULTADOS / LIMITE_BYTES (sai primeiro o menos usado).
+LIMITE_RESULTADOS = 8
+LIMITE_BYTES = 2 * 1024 ** 3
+_BLOCO_HASH = 1 << 20
+
+def impressao_digital(*grupos, **opcoes):
+    """Hash (hex) dos nomes e do conteúdo de cada grupo de fontes, na ordem, e das `opcoes`."""
+    h = hashlib.blake2b(digest_size=16)
+    for fontes in grupos:
+        h.update(b"\x00grupo")
+        for f in fontes:
+            h.update(nome_fonte(f).encode("utf-8", "replace") + b"\x00")
+            mem = memoria(f)
+            if mem is not None:
+                with mem: h.update(mem)
+            else:
+                with open(conteudo_fonte(f), "rb") as arq:
+                    for bloco in iter(lambda: arq.read(_BLOCO_HASH), b""): h.update(bloco)
+    h.update(repr(sorted(opcoes.items())).encode())
+    return h.hexdigest()
+
+def tamanho_resultado(valor):
+    """Memória aproximada de um resultado (DataFrames e tuplas/listas deles)."""
+    if hasattr(valor, "memory_usage"):
+        # deep: no pandas 2 o texto fica em colunas object, e sem isso só os ponteiros entrariam na conta
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, (tuple, list)): return sum(tamanho_resultado(v) for v in valor)
+    return 0
+
+class Tarefa:
+    """Uma auditoria: estado ("rodando", "concluída", "erro"), resultado/erro e o último andamento informado."""
+
+    def __init__(self, chave):
+        self.chave = chave
+        self.estado, self.resultado, self.erro = "rodando", None, None
+        self.andamento = None
+        self.inicio, self.fim, self.tamanho = time.time(), None, 0
+
+    @property
+    def pronta(self):
+        return self.estado != "rodando"
+
+    def avisar(self, estados):
+        # callback de progresso (ex.: ler_speds): guarda uma cópia para a interface ler quando quiser
+        self.andamento = [dict(e) for e in estados]
+
+class Tarefas:
+    """Registro de tarefas por chave, compartilhado entre as sessões do app (thread-safe)."""
+
+    def __init__(self, limite=LIMITE_RESULTADOS, limite_bytes=LIMITE_BYTES):
+        self.limite, self.limite_bytes = limite, limite_bytes
+        self._tarefas, self._trava = OrderedDict(), threading.Lock()
+
+    def iniciar(self, chave, funcao, *args, **kwargs):
+        """Tarefa da `chave`: a que já existe (em andamento ou pronta) ou uma nova, rodando funcao(tarefa, *args,
+        **kwargs) numa thread. Uma tarefa que terminou em erro é refeita."""
+        with self._trava:
+            t = self._tarefas.get(chave)
+            if t is not None and t.estado != "erro":
+                self._tarefas.move_to_end(chave); return t
+            t = self._tarefas[chave] = Tarefa(chave)
+        threading.Thread(target=self._rodar, args=(t, funcao, args, kwargs), name=f"auditoria-{chave[:8]}", daemon=True).start()
+        return t
+
+    def buscar(self, chave):
+        with self._trava:
+            t = self._tarefas.get(chave)
+            if t is not None: self._tarefas.move_to_end(chave)
+            return t
+
+    def descartar(self, chave):
+        with self._trava: self._tarefas.pop(chave, None)
+
+    def _rodar(self, t, funcao, args, kwargs):
+        try:
+            t.resultado = funcao(t, *args, **kwargs); t.tamanho = tamanho_resultado(t.resultado); t.estado = "concluída"
+        except Exception:
+            t.erro = traceback.format_exc(); t.estado = "erro"
+        finally:
+            t.fim = time.time(); self._despejar(t)
+
+    def _despejar(self, atual):
+        # só tarefas prontas saem, nunca a que acabou de terminar; as em andamento não contam para o limite
+        with self._trava:
+            prontas = [t for t in self._tarefas.values() if t.pronta and t is not atual]
+            total = sum(t.tamanho for t in prontas) + atual.tamanho
+            while prontas and (len(prontas) + 1 > self.limite or total > self.limite_bytes):
+                t = prontas.pop(0); total -= t.tamanho; del self._tarefas[t.chave]
@@ -0,0 +1,311 @@
+import xml.etree.ElementTree as ET
+import os, time
+from auditor.fontes import abrir_binario, tamanho_fonte, memoria, nome_fonte, conteudo_fonte, transportavel
+from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+# Sobe quando a regra de extração muda (invalida o cache em disco de auditor/cache.py)
+VERSAO_EXTRATOR = 1
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+
+# ---------- Extração em passada única ----------
+LIMIAR_FLUXO = 256 * 1024   # XMLs maiores que isso são lidos em fluxo (iterparse)
+
+def extrair_elementos(fonte, uri, tags, atributos=(), pronto=None):
+    """Devolve {tag: 1º elemento `tag` do XML}, na mesma ordem de `root.find('.//ns:tag')`.
+
+    Para as tags de `atributos` guarda só os atributos (dict), sem manter a subárvore. XMLs pequenos são
+    montados inteiros (ET em C é mais rápido que o laço de eventos); os grandes são percorridos com
+    iterparse, limpando o que já passou e parando assim que `pronto(achados)` for verdadeiro.
+    """
+    tam = tamanho_fonte(fonte)
+    if tam is not None and tam <= LIMIAR_FLUXO:
+        with abrir_binario(fonte) as f: root = ET.parse(f).getroot()
+        achados = {}
+        for t in tags:
+            el = root.find(f'.//{{{uri}}}{t}')
+            if el is not None: achados[t] = el
+        for t in atributos:
+            el = root.find(f'.//{{{uri}}}{t}')
+            if el is not None: achados[t] = dict(el.attrib)
+        return achados
+    mapa = {f'{{{uri}}}{t}': (t, False) for t in tags}
+    mapa.update({f'{{{uri}}}{t}': (t, True) for t in atributos})
+    achados, abertos = {}, {}
+    with abrir_binario(fonte) as f:
+        it = ET.iterparse(f, events=('start', 'end'))
+        next(it)  # a raiz não entra na busca './/'
+        for ev, el in it:
+            if ev == 'start':
+                alvo = mapa.get(el.tag)
+                if alvo is None or alvo[0] in achados: continue
+                t, so_atributos = alvo
+                if so_atributos:
+                    achados[t] = dict(el.attrib)
+                    if pronto and pronto(achados): break
+                elif t not in abertos.values():
+                    abertos[el] = t
+            elif abertos:
+                t = abertos.pop(el, None)
+                if t is not None:
+                    achados[t] = el
+                    if pronto and pronto(achados): break
+            else:
+                el.clear()
+    return achados
+
+# ---------- XML NF-e ----------
+_TAGS_NFE = ('ICMSTot', 'emit', 'dest')
+
+def _nfe_pronto(a):
+    return len(a) == 4
+
+def _dados_nfe(ach):
+    # dict da nota a partir dos elementos achados (infNFe como atributos, ICMSTot, emit, dest)
+    data, ns = {}, {'nfe': NS_NFE}
+    inf = ach.get('infNFe')
+    if inf is not None:
+        nfe_id = inf.get('Id')
+        data['Chave'] = (nfe_id[3:] if (nfe_id and nfe_id.startswith('NFe')) else nfe_id)
+    tot = ach.get('ICMSTot')
+    if tot is not None:
+        v = lambda tag: tot.find(f"nfe:{tag}", ns)
+        data['Valor ICMS XML'] = float((v('vICMS').text if v('vICMS') is not None and v('vICMS').text else 0) or 0)
+        data['Valor IPI XML']  = float((v('vIPI').text  if v('vIPI')  is not None and v('vIPI').text  else 0) or 0)
+        data['Valor Produtos XML'] = float((v('vProd').text if v('vProd') is not None and v('vProd').text else 0) or 0)
+    emit = ach.get('emit')
+    if emit is not None:
+        data['Emitente XML'] = (emit.find('nfe:xNome', ns).text if emit.find('nfe:xNome', ns) is not None else 'N/A')
+        data['CNPJ Emitente XML'] = (emit.find('nfe:CNPJ', ns).text if emit.find('nfe:CNPJ', ns) is not None else 'N/A')
+    dest = ach.get('dest')
+    if dest is not None:
+        data['Destinatário XML'] = (dest.find('nfe:xNome', ns).text if dest.find('nfe:xNome', ns) is not None else 'N/A')
+        data['CNPJ Destinatário XML'] = (dest.find('nfe:CNPJ', ns).text if dest.find('nfe:CNPJ', ns) is not None else 'N/A')
+    return data
+
+def parse_xml_nfe(xml_path):
+    try:
+        data = _dados_nfe(extrair_elementos(xml_path, NS_NFE, _TAGS_NFE, ('infNFe',), _nfe_pronto))
+        return data if data else None
+    except Exception:
+        return None
+
+# ---------- Itens da NF-e (det), só na conciliação item a item ----------
+# 'Itens' vai em colunas (uma lista por campo, na ordem de CAMPOS_ITEM_NFE): cabe no cache em JSON e vira as
+# colunas de auditor.conciliacao.tabela_itens_xml sem um dict por item.
+CAMPOS_ITEM_NFE = ("nItem", "cProd", "vBC", "pICMS", "vICMS", "vBC IPI", "pIPI", "vIPI")
+_N = f'{{{NS_NFE}}}'
+
+def _item_nfe(det, cols):
+    prod, imp = det.find(f'{_N}prod'), det.find(f'{_N}imposto')
+    icms = imp.find(f'{_N}ICMS') if imp is not None else None
+    grupo = icms[0] if icms is not None and len(icms) else None   # ICMS00, ICMS20, ICMSSN101...
+    ipi = imp.find(f'{_N}IPI/{_N}IPITrib') if imp is not None else None
+    cod = prod.find(f'{_N}cProd') if prod is not None else None
+    try: cols[0].append(int(det.get('nItem')))
+    except (TypeError, ValueError): cols[0].append(0)
+    cols[1].append((cod.text or '').strip() if cod is not None else '')
+    for col, (no, tag) in zip(cols[2:], ((grupo, 'vBC'), (grupo, 'pICMS'), (grupo, 'vICMS'), (ipi, 'vBC'), (ipi, 'pIPI'), (ipi, 'vIPI'))):
+        el = no.find(_N + tag) if no is not None else None
+        col.append(float(el.text) if el is not None and el.text else 0.0)
+
+def _percorrer_nfe(fonte, cols):
+    # achados como em extrair_elementos, com cada det já passado para `cols`; como lá, os XMLs pequenos são
+    # montados inteiros e os grandes lidos em fluxo, descartando cada det depois de lido
+    tam = tamanho_fonte(fonte)
+    if tam is not None and tam <= LIMIAR_FLUXO:
+        with abrir_binario(fonte) as f: root = ET.parse(f).getroot()
+        ach = {}
+        for t in _TAGS_NFE:
+            el = root.find(f'.//{_N}{t}')
+            if el is not None: ach[t] = el
+        inf = root.find(f'.//{_N}infNFe')
+        if inf is not None: ach['infNFe'] = dict(inf.attrib)
+        for det in root.iter(f'{_N}det'): _item_nfe(det, cols)
+        return ach
+    ach, alvos = {}, {_N + t: t for t in _TAGS_NFE}
+    with abrir_binario(fonte) as f:
+        for ev, el in ET.iterparse(f, events=('start', 'end')):
+            if ev == 'start':
+                if el.tag == _N + 'infNFe' and 'infNFe' not in ach: ach['infNFe'] = dict(el.attrib)
+            elif el.tag == _N + 'det':
+                _item_nfe(el, cols); el.clear()
+            else:
+                t = alvos.get(el.tag)
+                if t is not None and t not in ach: ach[t] = el
+    return ach
+
+def parse_xml_nfe_itens(xml_path):
+    """parse_xml_nfe mais 'Itens': det/prod/imposto de cada item, em colunas."""
+    try:
+        cols = tuple([] for _ in CAMPOS_ITEM_NFE)
+        data = _dados_nfe(_percorrer_nfe(xml_path, cols))
+        if not data: return None
+        data['Itens'] = [list(c) for c in cols]
+        return data
+    except Exception:
+        return None
+
+# ---------- XML CT-e ----------
+_TAGS_CTE = ('vPrest', 'ICMS', 'toma3', 'toma4', 'emit', 'rem', 'exped', 'receb', 'dest')
+_GRUPOS_ICMS_CTE = ['ICMS00','ICMS90','ICMS20','ICMS40','ICMS51','ICMS60','ICMS70','ICMSPart','ICMSST','ICMSCons','ICMSUFDest']
+_PARTE_TOMADOR = {'0': ('rem', "Remetente"), '1': ('exped', "Expedidor"), '2': ('receb', "Recebedor"), '3': ('dest', "Destinatário")}
+
+def _toma3(ach):
+    t = ach.get('toma3'); t = t.find(f'{{{NS_CTE}}}toma') if t is not None else None
+    return t.text if t is not None else ''
+
+def _cte_pronto(a):
+    if not all(k in a for k in ('infCte', 'vPrest', 'ICMS', 'emit', 'dest')): return False
+    if 'toma3' in a:
+        parte = _PARTE_TOMADOR.get(_toma3(a))
+        return parte is None or parte[0] in a
+    return 'toma4' in a
+
+def parse_xml_cte(xml_path):
+    d = {}
+    try:
+        ach = extrair_elementos(xml_path, NS_CTE, _TAGS_CTE, ('infCte',), _cte_pronto)
+        ns = {'cte': NS_CTE}
+        inf = ach.get('infCte')
+        if inf is not None:
+            cte_id = inf.get('Id'); d['Chave'] = (cte_id[3:] if (cte_id and cte_id.startswith('CTe')) else cte_id)
+        vPrest = ach.get('vPrest')
+        if vPrest is not None:
+            t = vPrest.find('cte:vTPrest', ns); d['Valor Total Prestação XML'] = float(t.text) if t is not None and t.text else 0.0
+        icms = ach.get('ICMS')
+        icms_outra = icms.find('cte:ICMSOutraUF', ns) if icms is not None else None
+        if icms_outra is not None:
+            v = lambda tag: icms_outra.find(f'cte:{tag}', ns)
+            d['BC ICMS XML'] = float(v('vBCOutraUF').text) if v('vBCOutraUF') is not None and v('vBCOutraUF').text else 0.0
+            d['Valor ICMS XML'] = float(v('vICMSOutraUF').text) if v('vICMSOutraUF') is not None and v('vICMSOutraUF').text else 0.0
+            d['Alíquota ICMS XML'] = float(v('pICMSOutraUF').text) if v('pICMSOutraUF') is not None and v('pICMSOutraUF').text else 0.0
+            cst = icms_outra.find('cte:CST', ns); d['CST XML'] = cst.text if cst is not None else 'N/A'
+        elif icms is not None:
+            for kind in _GRUPOS_ICMS_CTE:
+                node = icms.find(f'cte:{kind}', ns)
+                if node is not None:
+                    v = lambda tag: node.find(f'cte:{tag}', ns)
+                    d['BC ICMS XML'] = float(v('vBC').text) if v('vBC') is not None and v('vBC').text else 0.0
+                    d['Valor ICMS XML'] = float(v('vICMS').text) if v('vICMS') is not None and v('vICMS').text else 0.0
+                    d['Alíquota ICMS XML'] = float(v('pICMS').text) if v('pICMS') is not None and v('pICMS').text else 0.0
+                    cst = node.find('cte:CST', ns); d['CST XML'] = cst.text if cst is not None else 'N/A'
+                    break
+        # Tomador (toma3 simples)
+        tipo = "Não Identificado"; nome = "N/A"
+        parte = _PARTE_TOMADOR.get(_toma3(ach))
+        if parte is not None:
+            p = ach.get(parte[0]); x = p.find('cte:xNome', ns) if p is not None else None; nome = x.text if x is not None else 'N/A'; tipo = parte[1]
+        d['Tipo Tomador XML'] = tipo; d['Nome Tomador XML'] = nome
+        # Emit/Dest
+        emit = ach.get('emit')
+        if emit is not None:
+            xn = emit.find('cte:xNome', ns); c = emit.find('cte:CNPJ', ns)
+            d['Emitente XML'] = xn.text if xn is not None else 'N/A'; d['CNPJ Emitente XML'] = c.text if c is not None else 'N/A'
+        dest = ach.get('dest')
+        if dest is not None:
+            xn = dest.find('cte:xNome', ns); c = dest.find('cte:CNPJ', ns)
+            d['Destinatário XML'] = xn.text if xn is not None else 'N/A'; d['CNPJ Destinatário XML'] = c.text if c is not None else 'N/A'
+        return d if d else None
+    except Exception:
+        return None
+
+# ---------- Lote (pool de processos) ----------
+PARSERS = {'nfe': parse_xml_nfe, 'cte': parse_xml_cte, 'nfe_itens': parse_xml_nfe_itens}
+LOTE_PADRAO = 256       # XMLs por tarefa enviada ao pool
+MIN_PARALELO = 64       # abaixo disso o custo do pool não compensa
+
+def _nome_fonte(fonte, i):
+    return nome_fonte(fonte, f"xml #{i+1}")
+
+def _parse_lote(tipo, fontes, medir=False):
+    parse = PARSERS[tipo]
+    if not medir: return [parse(f) for f in fontes]
+    # com métricas: também (segundos, bytes) de cada XML
+    resultados, tempos = [], []
+    for f in fontes:
+        t = time.perf_counter(); resultados.append(parse(f)); tempos.append((time.perf_counter() - t, tamanho_fonte(f)))
+    return resultados, tempos
+
+def _conteudo(fonte):
+    mem = memoria(fonte)
+    if mem is not None: return mem
+    with open(conteudo_fonte(fonte), 'rb') as f: return f.read()
+
+def _blocos(fontes, lote):
+    bloco = []
+    for i, f in enumerate(fontes):
+        bloco.append((_nome_fonte(f, i), f))
+        if len(bloco) == lote: yield bloco; bloco = []
+    if bloco: yield bloco
+
+def _despachar(bloco, tipo, cache, ex, medir):
+    # separa o que já está no cache e envia o resto (1 vez por conteúdo) para o pool
+    hashes, prontos, faltam = None, {}, list(range(len(bloco)))
+    if cache is not None:
+        hashes = [cache.hash_conteudo(_conteudo(f)) for _, f in bloco]
+        prontos = cache.buscar(tipo, hashes); vistos = set(prontos); faltam = []
+        for i, h in enumerate(hashes):
+            if h not in vistos: vistos.add(h); faltam.append(i)
+    enviar = [transportavel(bloco[i][1], bloco[i][0]) if ex else bloco[i][1] for i in faltam]
+    try:
+        tarefa = ex.submit(_parse_lote, tipo, enviar, medir) if ex and enviar else _parse_lote(tipo, enviar, medir)
+    except (BrokenProcessPool, RuntimeError):
+        tarefa = _parse_lote(tipo, enviar, medir)
+    return bloco, hashes, prontos, faltam, enviar, tarefa, medir
+
+def _concluir(tipo, cache, bloco, hashes, prontos, faltam, enviar, tarefa, medir):
+    # devolve (bloco, resultados, tempos); tempos = {posição no bloco: (segundos, bytes)} só com métricas
+    if not isinstance(tarefa, Future): novos = tarefa
+    else:
+        try: novos = tarefa.result()
+        except BrokenProcessPool: novos = _parse_lote(tipo, enviar, medir)  # pool caiu: termina este bloco aqui mesmo
+    tempos = None
+    if medir: novos, tempos = novos; tempos = dict(zip(faltam, tempos))
+    if cache is None: return bloco, novos, tempos
+    novos = [(hashes[i], d) for i, d in zip(faltam, novos)]
+    if novos: cache.gravar(tipo, novos)
+    prontos.update(novos)
+    return bloco, [prontos[h] for h in hashes], tempos
+
+def _extrair(fontes, tipo, workers, lote, cache, medir=False):
+    """Gera (bloco, resultados, tempos) na ordem de entrada, com no máximo 2*workers blocos em andamento."""
+    blocos = _blocos(fontes, lote)
+    inicio = list(islice(blocos, 2))
+    ex = None
+    if workers > 1 and len(inicio) > 1 and sum(map(len, inicio)) >= MIN_PARALELO:
+        try: ex = ProcessPoolExecutor(max_workers=workers)
+        except (OSError, NotImplementedError): ex = None  # sem pool disponível (ex.: sandbox sem fork) -> segue serial
+    try:
+        fila = deque()
+        for bloco in chain(inicio, blocos):
+            fila.append(_despachar(bloco, tipo, cache, ex, medir))
+            if len(fila) > 2 * workers: yield _concluir(tipo, cache, *fila.popleft())
+        while fila: yield _concluir(tipo, cache, *fila.popleft())
+    finally:
+        if ex is not None: ex.shutdown(cancel_futures=True)
+
+def processar_xmls(fontes, tipo='nfe', workers=None, lote=LOTE_PADRAO, cache=None, metricas=None):
+    """Extrai um lote de XMLs (caminhos, bytes, BytesIO ou tuplas (nome, conteúdo)) e devolve (xml_map, invalidos).
+
+    `fontes` pode ser um gerador (ex.: membros de um ZIP): os XMLs são lidos aos blocos de `lote` itens e
+    distribuídos entre `workers` processos (padrão: todos os núcleos), sem carregar tudo de uma vez. O resultado
+    é idêntico ao do laço serial com parse_xml_nfe/parse_xml_cte. Com `cache` (auditor.cache.CacheXML), XMLs de
+    conteúdo já visto não são lidos de novo. Com `metricas` (auditor.metricas.Metricas), o tempo de cada XML lido
+    entra nos destaques. Com tipo 'nfe_itens', cada nota traz também 'Itens' (ver parse_xml_nfe_itens).
+    """
+    if tipo not in PARSERS: raise ValueError(f"Tipo de XML desconhecido: {tipo}")
+    workers = workers or os.cpu_count() or 1
+    # mesma regra do laço serial: XML sem chave vai para a lista de inválidos, chave repetida -> vale o último
+    xml_map, invalidos = {}, []
+    for bloco, resultados, tempos in _extrair(fontes, tipo, workers, lote, cache, metricas is not None):
+        for (nome, _), d in zip(bloco, resultados):
+            if d and 'Chave' in d: xml_map[d['Chave']] = d
+            else: invalidos.append(nome)
+        if tempos:
+            for i, (segundos, tamanho) in tempos.items(): metricas.arquivo('xml', bloco[i][0], segundos, tamanho)
+    return xml_map, invalidos
@@ -0,0 +1,44 @@
+"""Micro-benchmark: detecção de codificação do SPED (auditor.codificacao x chardet em 10 KB).
+
+Uso: python bench/bench_codificacao.py [repetições]
+"""
+import os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from auditor.codificacao import codificacao_bytes, PADRAO_SPED
+
+def _sped(enc, linhas=50000):
+    # cabeçalho só ASCII e acentos só lá no meio do arquivo: o caso em que o chardet erra
+    corpo = "".join(f"|C100|0|1|P{i}|55|00|1|{i}|{i:044d}|05012024|06012024|100,00|0|\n" for i in range(linhas))
+    meio = "|0200|P1|Produto com acentuação: ÇÃO é í ó ú|||UN|\n"
+    return ("|0000|017|0|01012024|31012024|EMPRESA|12345678000199||SP|\n" + corpo + meio + corpo).encode(enc)
+
+def _chardet(dados):
+    import chardet
+    return chardet.detect(dados[:10000]).get('encoding') or 'latin-1'
+
+def _nova(dados, bloco=16 * 1024 * 1024):
+    # mesma regra do ler_sped: o primeiro bloco que não é só ASCII decide
+    for i in range(0, len(dados), bloco):
+        enc = codificacao_bytes(dados[i:i+bloco])
+        if enc: return enc
+    return PADRAO_SPED
+
+def _medir(f, dados, n):
+    t = time.perf_counter()
+    for _ in range(n): r = f(dados)
+    return r, (time.perf_counter() - t) / n
+
+def main(n=20):
+    try: import chardet  # noqa: F401
+    except ImportError: chardet = None
+    print(f"{'arquivo':<10} {'MB':>6} {'detector':<9} {'resultado':<10} {'ms':>9} {'decodifica certo':>17}")
+    for enc in ('latin-1', 'utf-8', 'cp1252'):
+        dados = _sped(enc); esperado = dados.decode(enc)
+        detectores = [("nova", _nova)] + ([("chardet", _chardet)] if chardet else [])
+        for nome, f in detectores:
+            r, s = _medir(f, dados, n)
+            print(f"{enc:<10} {len(dados)/1e6:>6.1f} {nome:<9} {r:<10} {s*1000:>9.3f} {str(dados.decode(r, 'ignore') == esperado):>17}")
+    if not chardet: print("(chardet não instalado: só a detecção nova foi medida)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,54 @@
+"""Benchmark da exportação: pandas.ExcelWriter (caminho antigo) x auditor.exportar (xlsx/csv/parquet).
+
+Cada modo roda num processo próprio, e o pico de memória (ru_maxrss) é medido antes e depois da exportação.
+Uso: python bench/bench_exportar.py [linhas] [modos...]   (padrão: 400000 antigo xlsx csv parquet)
+"""
+import io, json, os, resource, subprocess, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def resultado_sintetico(n):
+    """DataFrame no formato do resultado de NF-e, com n linhas."""
+    import numpy as np, pandas as pd
+    from auditor.conciliacao import COLUNAS_NFE, NUMERICAS_NFE
+    rng = np.random.default_rng(0); i = np.arange(n)
+    df = pd.DataFrame({c: rng.random(n).round(2) * 1000 for c in NUMERICAS_NFE})
+    texto = {"Competência": "01/2024", "Série da nota": "1", "CFOP": "1102", "XML Encontrado": "Sim", "Status Auditoria": "OK",
+             "Emitente XML": "FORNECEDOR EXEMPLO LTDA", "Destinatário XML": "EMPRESA EXEMPLO SA",
+             "CNPJ Emitente XML": "12345678000199", "CNPJ Destinatário XML": "98765432000155", "Data de emissão": "05012024"}
+    for c, v in texto.items(): df[c] = v
+    df["Número da nota"] = (i + 1).astype(str); df["Chave"] = [f"{k:044d}" for k in i]
+    return df[COLUNAS_NFE]
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # Linux: KB
+
+def _rodar(modo, n):
+    import pandas as pd
+    from auditor.exportar import exportar
+    df = resultado_sintetico(n); avisos = [f"Aviso {k}" for k in range(100)]
+    antes, t = _rss_mb(), time.perf_counter()
+    if modo == "antigo":
+        buf = io.BytesIO()
+        with pd.ExcelWriter(buf, engine="openpyxl") as w:
+            df.to_excel(w, index=False, sheet_name="NF-e")
+            pd.DataFrame({"Avisos": avisos}).to_excel(w, index=False, sheet_name="Avisos")
+    else:
+        buf = exportar(df, avisos, modo, "NF-e")
+    return {"modo": modo, "linhas": n, "segundos": time.perf_counter() - t, "mb_saida": len(buf.getvalue()) / 1e6,
+            "rss_antes_mb": antes, "pico_mb": _rss_mb()}
+
+def main(n=400_000, modos=("antigo", "xlsx", "csv", "parquet")):
+    print(f"{'modo':<8} {'linhas':>8} {'s':>7} {'MB arquivo':>10} {'RSS antes':>10} {'pico':>8} {'pico extra':>10}")
+    for modo in modos:
+        p = subprocess.run([sys.executable, __file__, "--um", modo, str(n)], capture_output=True, text=True)
+        if p.returncode:
+            print(f"{modo:<8} falhou: {p.stderr.strip().splitlines()[-1] if p.stderr.strip() else p.returncode}"); continue
+        r = json.loads(p.stdout)
+        print(f"{modo:<8} {n:>8} {r['segundos']:>7.1f} {r['mb_saida']:>10.1f} {r['rss_antes_mb']:>10.0f} {r['pico_mb']:>8.0f} "
+              f"{r['pico_mb'] - r['rss_antes_mb']:>10.0f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--um"]:
+        print(json.dumps(_rodar(sys.argv[2], int(sys.argv[3]))))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 400_000, tuple(sys.argv[2:]) or ("antigo", "xlsx", "csv", "parquet"))
@@ -0,0 +1,149 @@
+"""Benchmark do fluxo completo da auditoria, etapa por etapa, sobre um lote sintético (bench/sinteticos.py).
+
+Para NF-e e CT-e mede abertura dos ZIPs enviados, leitura dos XMLs, leitura dos SPEDs, conciliação e exportação
+para .xlsx: tempo, vazão (itens/s e MB/s) e pico de memória do processo em cada etapa. Confere o resultado com o
+esperado pelo gerador e compara com a base gravada em bench/base_pipeline.json (com --gravar-base, regrava).
+
+Uso: python bench/bench_pipeline.py [--competencias N] [--nfe N | --mb MB] [--cte N] [-w N] [--dados DIR] [--gravar-base]
+Sai com código 1 se alguma etapa piorar além de --limite em relação à base, e 2 se o resultado não conferir.
+"""
+import argparse, json, os, platform, shutil, sys, tempfile, time
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+from sinteticos import gerar_lote, contagens_por_mb
+from auditor.metricas import zerar_pico, pico_mb
+
+BASE = os.path.join(AQUI, "base_pipeline.json")
+
+# ---------- Etapas ----------
+# Pico de memória por etapa como em auditor.metricas: processos do pool não entram na conta.
+def _etapa(resultados, nome, f, itens=None, bytes_=0):
+    """Roda f(), grava tempo/vazão/pico em resultados[nome] e devolve o retorno de f."""
+    zerar_pico(); t = time.perf_counter()
+    r = f()
+    s = time.perf_counter() - t
+    n, pico = (itens(r) if callable(itens) else itens), pico_mb()
+    resultados[nome] = {"segundos": round(s, 4), "itens": n, "mb": round(bytes_ / 1e6, 2), "pico_mb": round(pico, 1) if pico is not None else None,
+                        "itens_s": round(n / s, 1) if n and s else None, "mb_s": round(bytes_ / 1e6 / s, 1) if bytes_ and s else None}
+    return r
+
+# ---------- Fluxo ----------
+def medir(lote, workers=None):
+    """Etapas do fluxo de auditoria (como em auditor.auditoria.preparar/conciliar) para NF-e e CT-e."""
+    from auditor.compactados import expandir_compactados
+    from auditor.xmls import processar_xmls
+    from auditor.sped import ler_speds
+    from auditor.conciliacao import tabela_xml, conciliar_nfe, conciliar_cte
+    from auditor.exportar import exportar
+    resultados, conferencia = {}, {}
+    tam_speds = sum(os.path.getsize(p) for p in lote["speds"])
+    for tipo, conciliar, rotulo in (("nfe", conciliar_nfe, "NF-e"), ("cte", conciliar_cte, "CT-e")):
+        zips, avisos = lote["xmls"][tipo], []
+        membros = _etapa(resultados, f"{tipo}.zip", lambda: list(expandir_compactados(zips, tipo, avisos)), len,
+                         sum(os.path.getsize(p) for p in zips))
+        tam_xml = sum(len(m[1]) if isinstance(m, tuple) else os.path.getsize(m) for m in membros)
+        xml_map, invalidos = _etapa(resultados, f"{tipo}.xml", lambda m=membros: processar_xmls(m, tipo, workers=workers),
+                                    len(membros), tam_xml)
+        del membros
+        notas, avisos_sped = _etapa(resultados, f"{tipo}.sped", lambda: ler_speds(lote["speds"], tipo, workers),
+                                    lambda r: len(r[0]), tam_speds)
+        df = _etapa(resultados, f"{tipo}.conciliacao", lambda: conciliar(notas, tabela_xml(xml_map, tipo)), len(notas))
+        saida = _etapa(resultados, f"{tipo}.exportacao", lambda: exportar(df, avisos + avisos_sped, "xlsx", rotulo), len(df))
+        r = resultados[f"{tipo}.exportacao"]; r["mb"] = round(len(saida.getvalue()) / 1e6, 2); r["mb_s"] = round(r["mb"] / r["segundos"], 1)
+        status = df["Status Auditoria"]
+        conferencia[tipo] = {"notas": len(df), "sem_xml": int((status == "XML Não Encontrado").sum()),
+                             "divergentes": int(status.str.startswith("Divergência").sum()), "xml": len(xml_map) + len(invalidos)}
+    return resultados, conferencia
+
+def conferir(conferencia, esperado):
+    """Diferenças entre o resultado e o que o gerador escreveu ([] se tudo confere)."""
+    erros = []
+    for tipo, r in conferencia.items():
+        for campo, chave in (("notas", tipo), ("sem_xml", f"{tipo}_sem_xml"), ("divergentes", f"{tipo}_divergentes"), ("xml", f"xml_{tipo}")):
+            if r[campo] != esperado[chave]: erros.append(f"{tipo}: {campo} = {r[campo]}, esperado {esperado[chave]}")
+    return erros
+
+# ---------- Base de comparação ----------
+def comparar(resultados, base, limite):
+    """Imprime a comparação com a base; devolve as etapas que pioraram mais que `limite` (fração) em tempo ou memória."""
+    piores = []
+    print(f"\n{'etapa':<18} {'s':>8} {'base':>8} {'razão':>6} {'pico MB':>8} {'base':>8}")
+    for nome, r in resultados.items():
+        b = base.get(nome)
+        if not b: print(f"{nome:<18} {r['segundos']:>8.3f} {'-':>8}"); continue
+        razao = r["segundos"] / b["segundos"] if b["segundos"] else 1.0
+        mem = r["pico_mb"] is not None and b["pico_mb"] is not None   # sem medida de memória (Windows): só o tempo
+        pior = (razao > 1 + limite and r["segundos"] - b["segundos"] > 0.05) or (mem and r["pico_mb"] > b["pico_mb"] * (1 + limite) + 20)
+        if pior: piores.append(nome)
+        print(f"{nome:<18} {r['segundos']:>8.3f} {b['segundos']:>8.3f} {razao:>6.2f} {r['pico_mb'] or 0:>8.0f} {b['pico_mb'] or 0:>8.0f}"
+              + ("  <- piorou" if pior else ""))
+    return piores
+
+def _parametros(a):
+    return {"competencias": a.competencias, "nfe": a.nfe, "cte": a.cte, "workers": a.workers}
+
+def _maquina():
+    return {"python": platform.python_version(), "sistema": platform.platform(), "cpus": os.cpu_count()}
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark do fluxo de auditoria com SPEDs e XMLs sintéticos.")
+    p.add_argument("--competencias", type=int, default=3)
+    p.add_argument("--nfe", type=int, default=20000, help="NF-e por competência")
+    p.add_argument("--cte", type=int, default=5000, help="CT-e por competência")
+    p.add_argument("--mb", type=float, default=None, help="tamanho aproximado de cada SPED em MB (substitui --nfe/--cte)")
+    p.add_argument("-w", "--workers", type=int, default=1, help="processos de leitura (padrão: 1, para medir sem o pool)")
+    p.add_argument("--dados", default=None, help="diretório do lote sintético (reaproveitado se gerado com os mesmos parâmetros)")
+    p.add_argument("--base", default=BASE, help="arquivo da base de comparação")
+    p.add_argument("--gravar-base", action="store_true", help="grava este resultado como nova base")
+    p.add_argument("--limite", type=float, default=0.25, help="piora tolerada em relação à base (fração; padrão 0,25)")
+    p.add_argument("--json", default=None, help="grava também o resultado completo neste arquivo")
+    a = p.parse_args(argv)
+    if a.mb: a.nfe, a.cte = contagens_por_mb(a.mb, a.nfe, a.cte)
+    parametros = _parametros(a)
+
+    dados = a.dados or tempfile.mkdtemp(prefix="bench_auditor_")
+    marca = os.path.join(dados, "lote.json")
+    try:
+        lote = None
+        if os.path.exists(marca):
+            with open(marca, encoding="utf-8") as f: lote = json.load(f)
+            if lote.get("parametros") != {k: v for k, v in parametros.items() if k != "workers"}: lote = None
+        if lote is None:
+            t = time.perf_counter()
+            lote = gerar_lote(dados, a.competencias, a.nfe, a.cte)
+            lote["parametros"] = {k: v for k, v in parametros.items() if k != "workers"}
+            with open(marca, "w", encoding="utf-8") as f: json.dump(lote, f)
+            print(f"Lote sintético gerado em {time.perf_counter() - t:.1f}s: {dados}")
+        tam = sum(os.path.getsize(p) for p in lote["speds"]) / 1e6
+        print(f"{len(lote['speds'])} SPED(s), {tam:,.1f} MB; {lote['esperado']['nfe']} NF-e, {lote['esperado']['cte']} CT-e; workers={a.workers}")
+
+        resultados, conferencia = medir(lote, a.workers)
+    finally:
+        if not a.dados: shutil.rmtree(dados, ignore_errors=True)
+
+    print(f"\n{'etapa':<18} {'s':>8} {'itens':>9} {'itens/s':>10} {'MB':>8} {'MB/s':>7} {'pico MB':>8}")
+    for nome, r in resultados.items():
+        print(f"{nome:<18} {r['segundos']:>8.3f} {r['itens'] or 0:>9} {r['itens_s'] or 0:>10,.0f} {r['mb']:>8.1f} "
+              f"{r['mb_s'] or 0:>7.1f} {r['pico_mb'] or 0:>8.0f}")
+    erros = conferir(conferencia, lote["esperado"])
+    print("\nConferência: " + ("resultado igual ao esperado." if not erros else "; ".join(erros)))
+
+    registro = {"parametros": parametros, "maquina": _maquina(), "etapas": resultados}
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f: json.dump(registro, f, indent=1, ensure_ascii=False)
+    piores = []
+    if a.gravar_base:
+        with open(a.base, "w", encoding="utf-8") as f: json.dump(registro, f, indent=1, ensure_ascii=False); f.write("\n")
+        print(f"Base gravada em {a.base}.")
+    elif os.path.exists(a.base):
+        with open(a.base, encoding="utf-8") as f: base = json.load(f)
+        if base["parametros"] != parametros:
+            print(f"\nBase gravada com outros parâmetros ({base['parametros']}); sem comparação.")
+        else:
+            if base["maquina"] != _maquina(): print(f"\nAviso: base medida em outra máquina ({base['maquina']}).")
+            piores = comparar(resultados, base["etapas"], a.limite)
+            print("\n" + (f"Pioraram mais de {a.limite:.0%}: {', '.join(piores)}" if piores else "Nenhuma etapa piorou em relação à base."))
+    return 2 if erros else 1 if piores else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Geradores de SPED (EFD ICMS/IPI) e de XMLs de NF-e/CT-e sintéticos, coerentes entre si, para os benchmarks.
+
+As notas de cada competência saem de um gerador com semente fixa: o SPED e os XMLs percorrem a mesma sequência,
+então casam sem que nada fique em memória (dá para gerar SPEDs de vários GB). Parte das notas fica sem XML,
+parte tem ICMS divergente no XML, e há C100/D100 truncados e linhas de lixo para exercitar os avisos.
+
+Uso: python bench/sinteticos.py DESTINO [--competencias N] [--nfe N | --mb MB] [--cte N] [--sem-zip] ...
+"""
+import argparse, io, json, os, random, sys, zipfile
+
+CNPJ_EMPRESA = "12345678000199"
+FORNECEDORES = [("11222333000181", "Fábrica São João Ltda"), ("22333444000172", "Comércio Ação & Cia"),
+                ("33444555000163", "Indústria Ômega S.A."), ("44555666000154", "Distribuidora Pêra–Uva")]
+TRANSPORTADORAS = [("55666777000145", "Transportes Ícaro Ltda"), ("66777888000136", "Logística Açores")]
+CFOPS_NFE, CFOPS_CTE = ("1102", "2102", "1556", "2556"), ("1352", "2352")
+ALIQUOTAS_NFE, ALIQUOTAS_CTE = (4, 7, 12, 18), (7, 12)
+CODIFICACOES = ("latin-1", "utf-8", "cp1252")
+
+def _br(v): return f"{v:.2f}".replace(".", ",")
+
+def _chave(aamm, cnpj, modelo, numero, cnf):
+    # UF + AAMM + CNPJ + modelo + série + número + tpEmis + cNF + DV: 44 dígitos, únicos por competência/número
+    return f"35{aamm}{cnpj}{modelo}001{numero:09d}1{cnf:08d}0"
+
+# ---------- Notas (mesma sequência para o SPED e para os XMLs) ----------
+def notas_nfe(n, competencia, semente=0, casamento=0.9, divergencia=0.05, itens=3, malformadas=0.0):
+    """Gera n NF-e da competência 'MM/AAAA' como dicts; mesma semente -> mesma sequência."""
+    mes, ano = competencia.split("/"); aamm = ano[2:] + mes
+    rng = random.Random(f"nfe{semente}{competencia}")
+    for i in range(n):
+        cnpj, nome = rng.choice(FORNECEDORES)
+        linhas = []
+        for _ in range(rng.randint(1, itens)):
+            vp = round(rng.uniform(10, 5000), 2); aliq = rng.choice(ALIQUOTAS_NFE)
+            linhas.append((rng.choice(CFOPS_NFE), vp, aliq, round(vp * aliq / 100, 2), round(vp * 0.05, 2) if rng.random() < 0.5 else 0.0))
+        icms, ipi = round(sum(l[3] for l in linhas), 2), round(sum(l[4] for l in linhas), 2)
+        tem_xml, diverge = rng.random() < casamento, rng.random() < divergencia
+        yield {"chave": _chave(aamm, cnpj, "55", i + 1, rng.randrange(10**8)), "numero": i + 1, "data": f"{rng.randint(1, 28):02d}{mes}{ano}",
+               "cnpj": cnpj, "nome": nome, "itens": linhas, "total": round(sum(l[1] for l in linhas) + ipi, 2), "icms": icms, "ipi": ipi,
+               "icms_xml": round(icms + rng.choice((-1, 1)) * rng.uniform(1, 50), 2) if diverge else icms,
+               "tem_xml": tem_xml, "diverge": tem_xml and diverge, "malformada": rng.random() < malformadas}
+
+def notas_cte(n, competencia, semente=0, casamento=0.9, divergencia=0.05, malformadas=0.0):
+    """Gera n CT-e da competência 'MM/AAAA' como dicts; mesma semente -> mesma sequência."""
+    mes, ano = competencia.split("/"); aamm = ano[2:] + mes
+    rng = random.Random(f"cte{semente}{competencia}")
+    for i in range(n):
+        cnpj, nome = rng.choice(TRANSPORTADORAS)
+        vt = round(rng.uniform(100, 10000), 2); aliq = rng.choice(ALIQUOTAS_CTE); icms = round(vt * aliq / 100, 2)
+        tem_xml, diverge = rng.random() < casamento, rng.random() < divergencia
+        yield {"chave": _chave(aamm, cnpj, "57", i + 1, rng.randrange(10**8)), "numero": i + 1, "data": f"{rng.randint(1, 28):02d}{mes}{ano}",
+               "cnpj": cnpj, "nome": nome, "valor": vt, "bc": vt, "aliquota": aliq, "icms": icms, "cfop": rng.choice(CFOPS_CTE),
+               "icms_xml": round(icms + rng.choice((-1, 1)) * rng.uniform(1, 50), 2) if diverge else icms,
+               "tem_xml": tem_xml, "diverge": tem_xml and diverge, "malformada": rng.random() < malformadas}
+
+# ---------- SPED ----------
+def _linhas_nfe(n, extras):
+    # malformada: C100 sem chave nem valores -> "C100 malformado"; metade delas cortada logo após o código, seguida
+    # dos C170 (que não podem ir parar na nota anterior)
+    if n["malformada"] and n["numero"] % 2: yield "|C100|0|1|F1|55|"; return
+    if n["malformada"]: yield "|C100"
+    else: yield (f"|C100|0|1|F{n['cnpj'][:4]}|55|00|1|{n['numero']}|{n['chave']}|{n['data']}|{n['data']}|{_br(n['total'])}|0|0|0|"
+                 f"{_br(n['total'] - n['ipi'])}|0|0|0|0|{_br(n['total'] - n['ipi'])}|{_br(n['icms'])}|0|0|{_br(n['ipi'])}|0|0|0|0|0|")
+    for k, (cfop, vp, aliq, vicms, vipi) in enumerate(n["itens"], 1):
+        bc_ipi, aliq_ipi = (_br(vp), "5") if vipi else ("0", "0")
+        yield (f"|C170|{k}|P{k:04d}||1|UN|{_br(vp)}|0|0|000|{cfop}||{_br(vp)}|{_br(aliq)}|{_br(vicms)}|0|0|0|0|50||"
+               f"{bc_ipi}|{aliq_ipi}|{_br(vipi)}|||")
+    for cfop, vp, aliq, vicms, _ in n["itens"][:extras]:
+        yield f"|C190|000|{cfop}|{_br(aliq)}|{_br(vp)}|{_br(vp)}|{_br(vicms)}|0|0|0|0||"
+
+def _linhas_cte(c):
+    if c["malformada"]: yield "|D100|0|1|"; return
+    yield (f"|D100|0|1|T{c['cnpj'][:4]}|57|00|1||{c['numero']}|{c['chave']}|{c['data']}|{c['data']}|0||{_br(c['valor'])}|0|1|"
+           f"{_br(c['valor'])}|{_br(c['bc'])}|{_br(c['icms'])}|0|||")
+    yield f"|D190|000|{c['cfop']}|{_br(c['aliquota'])}|{_br(c['valor'])}|{_br(c['bc'])}|{_br(c['icms'])}|0||"
+
+def gerar_sped(destino, competencia, nfe=(), cte=(), codificacao="latin-1", lixo=0.0, extras=1, semente=0, eol="\r\n"):
+    """Grava um SPED com as notas dos iteráveis `nfe`/`cte` (de notas_nfe/notas_cte); devolve o resumo esperado.
+
+    `lixo` é a fração de notas seguidas de uma linha sem layout de registro; `extras` é o número de C190 por NF-e.
+    """
+    mes, ano = competencia.split("/"); rng = random.Random(f"lixo{semente}{competencia}")
+    resumo = {"nfe": 0, "nfe_sem_xml": 0, "nfe_divergentes": 0, "cte": 0, "cte_sem_xml": 0, "cte_divergentes": 0, "malformadas": 0}
+    with open(destino, "w", encoding=codificacao, errors="replace", newline="", buffering=1 << 20) as f:
+        w = lambda linha: f.write(linha + eol)
+        w(f"|0000|017|0|01{mes}{ano}|28{mes}{ano}|Empresa Auditada Indústria e Comércio Ltda|{CNPJ_EMPRESA}||SP|110042490114||3550308||A|1|")
+        w("|0001|0|")
+        for cnpj, nome in FORNECEDORES + TRANSPORTADORAS:
+            w(f"|0150|F{cnpj[:4]}|{nome}|01058|{cnpj}|||3550308||Rua São Bento|100||Centro|")
+        w("|0990|0|"); w("|C001|0|")
+        for tipo, notas, linhas in (("nfe", nfe, lambda n: _linhas_nfe(n, extras)), ("cte", cte, _linhas_cte)):
+            if tipo == "cte": w("|C990|0|"); w("|D001|0|")
+            for n in notas:
+                for linha in linhas(n): w(linha)
+                if rng.random() < lixo: w("registro corrompido sem separadores ÇÃO")
+                if n["malformada"]: resumo["malformadas"] += 1; continue
+                resumo[tipo] += 1; resumo[f"{tipo}_sem_xml"] += not n["tem_xml"]; resumo[f"{tipo}_divergentes"] += n["diverge"]
+        w("|D990|0|"); w("|9999|0|")
+    return resumo
+
+# ---------- XMLs ----------
+def xml_nfe(n):
+    # a divergência do ICMS total fica toda no 1º item (é onde a conciliação item a item deve apontá-la)
+    dets = "".join(
+        f'<det nItem="{k}"><prod><cProd>P{k:04d}</cProd><xProd>Produto {k}</xProd><CFOP>{"5" if cfop[0] == "1" else "6"}{cfop[1:]}</CFOP>'
+        f'<vProd>{vp:.2f}</vProd></prod><imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><vBC>{vp:.2f}</vBC><pICMS>{aliq:.2f}</pICMS>'
+        f'<vICMS>{vicms + (n["icms_xml"] - n["icms"] if k == 1 else 0):.2f}</vICMS></ICMS00></ICMS><IPI><cEnq>999</cEnq><IPITrib><CST>50</CST>'
+        + (f'<vBC>{vp:.2f}</vBC><pIPI>5.00</pIPI>' if vipi else '') + f'<vIPI>{vipi:.2f}</vIPI></IPITrib></IPI></imposto></det>'
+        for k, (cfop, vp, aliq, vicms, vipi) in enumerate(n["itens"], 1))
+    nome = n["nome"].replace("&", "&amp;")
+    return (f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+            f'<NFe xmlns="http://www.portalfiscal.inf.br/nfe"><infNFe versao="4.00" Id="NFe{n["chave"]}"><ide><cUF>35</cUF><nNF>{n["numero"]}</nNF></ide>'
+            f'<emit><CNPJ>{n["cnpj"]}</CNPJ><xNome>{nome}</xNome><enderEmit><xLgr>Rua São Bento</xLgr></enderEmit></emit>'
+            f'<dest><CNPJ>{CNPJ_EMPRESA}</CNPJ><xNome>Empresa Auditada Indústria e Comércio Ltda</xNome></dest>{dets}'
+            f'<total><ICMSTot><vBC>{n["total"] - n["ipi"]:.2f}</vBC><vICMS>{n["icms_xml"]:.2f}</vICMS><vProd>{n["total"] - n["ipi"]:.2f}</vProd>'
+            f'<vIPI>{n["ipi"]:.2f}</vIPI><vNF>{n["total"]:.2f}</vNF></ICMSTot></total></infNFe>'
+            f'<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo/></Signature></NFe>'
+            f'<protNFe versao="4.00"><infProt><chNFe>{n["chave"]}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>').encode("utf-8")
+
+def xml_cte(c):
+    return (f'<?xml version="1.0" encoding="UTF-8"?><cteProc xmlns="http://www.portalfiscal.inf.br/cte" versao="4.00">'
+            f'<CTe xmlns="http://www.portalfiscal.inf.br/cte"><infCte versao="4.00" Id="CTe{c["chave"]}"><ide><cUF>35</cUF><nCT>{c["numero"]}</nCT>'
+            f'<toma3><toma>3</toma></toma3></ide><emit><CNPJ>{c["cnpj"]}</CNPJ><xNome>{c["nome"]}</xNome></emit>'
+            f'<rem><CNPJ>{FORNECEDORES[0][0]}</CNPJ><xNome>{FORNECEDORES[0][1]}</xNome></rem>'
+            f'<dest><CNPJ>{CNPJ_EMPRESA}</CNPJ><xNome>Empresa Auditada Indústria e Comércio Ltda</xNome></dest>'
+            f'<vPrest><vTPrest>{c["valor"]:.2f}</vTPrest><vRec>{c["valor"]:.2f}</vRec></vPrest><imp><ICMS><ICMS00><CST>00</CST>'
+            f'<vBC>{c["bc"]:.2f}</vBC><pICMS>{c["aliquota"]:.2f}</pICMS><vICMS>{c["icms_xml"]:.2f}</vICMS></ICMS00></ICMS></imp></infCte></CTe>'
+            f'<protCTe versao="4.00"><infProt><chCTe>{c["chave"]}</chCTe><cStat>100</cStat></infProt></protCTe></cteProc>').encode("utf-8")
+
+def gerar_xmls(destino, notas, tipo, compactar=False, invalidos=0.0, semente=0):
+    """Grava os XMLs das notas com `tem_xml` em `destino` (diretório, ou um .zip com compactar=True).
+
+    `invalidos` é a fração de XMLs truncados (vão para a lista de inválidos). Devolve (caminhos gerados, quantidade de XMLs).
+    """
+    montar, rng = (xml_nfe if tipo == "nfe" else xml_cte), random.Random(f"xml{semente}{destino}")
+    os.makedirs(destino if not compactar else os.path.dirname(destino) or ".", exist_ok=True)
+    zf = zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED, compresslevel=1) if compactar else None
+    caminhos, n = [destino] if compactar else [], 0
+    try:
+        for nota in notas:
+            if not nota["tem_xml"]: continue
+            dados = montar(nota); n += 1
+            if rng.random() < invalidos: dados = dados[:len(dados) // 2]
+            nome = f"{nota['chave']}-{'procNFe' if tipo == 'nfe' else 'procCTe'}.xml"
+            if zf: zf.writestr(nome, dados)
+            else:
+                caminho = os.path.join(destino, nome); caminhos.append(caminho)
+                with open(caminho, "wb") as f: f.write(dados)
+    finally:
+        if zf: zf.close()
+    return caminhos, n
+
+# ---------- Lote completo ----------
+def competencias(n, inicio="01/2024"):
+    mes, ano = map(int, inicio.split("/"))
+    return [f"{(mes - 1 + k) % 12 + 1:02d}/{ano + (mes - 1 + k) // 12}" for k in range(n)]
+
+def bytes_por_nota(tipo, extras=1, amostra=500):
+    """Tamanho médio de uma nota no SPED (para gerar por tamanho em MB)."""
+    buf = io.StringIO()
+    notas = notas_nfe(amostra, "01/2024") if tipo == "nfe" else notas_cte(amostra, "01/2024")
+    for n in notas: buf.writelines(l + "\r\n" for l in (_linhas_nfe(n, extras) if tipo == "nfe" else _linhas_cte(n)))
+    return len(buf.getvalue().encode("latin-1", "replace")) / amostra
+
+def contagens_por_mb(mb, nfe, cte, extras=1):
+    """(NF-e, CT-e) por competência para um SPED de ~`mb` MB, mantendo a proporção entre `nfe` e `cte`."""
+    por_nota = (nfe * bytes_por_nota("nfe", extras) + cte * bytes_por_nota("cte")) / max(nfe + cte, 1)
+    escala = mb * 1e6 / por_nota / max(nfe + cte, 1)
+    return int(nfe * escala), int(cte * escala)
+
+def gerar_lote(destino, n_competencias=3, nfe=2000, cte=500, casamento=0.9, divergencia=0.05, malformadas=0.001,
+               lixo=0.001, xml_invalidos=0.0, compactar=True, codificacoes=CODIFICACOES, extras=1, semente=0):
+    """SPEDs (um por competência, alternando `codificacoes`) e XMLs de NF-e/CT-e em `destino`.
+
+    Devolve {'speds': [...], 'xmls': {'nfe': [...], 'cte': [...]}, 'esperado': totais somados dos resumos}.
+    """
+    os.makedirs(destino, exist_ok=True)
+    lote = {"speds": [], "xmls": {"nfe": [], "cte": []}, "esperado": {}}
+    opcoes = dict(semente=semente, casamento=casamento, divergencia=divergencia, malformadas=malformadas)
+    for k, comp in enumerate(competencias(n_competencias)):
+        sufixo = comp[3:] + comp[:2]; enc = codificacoes[k % len(codificacoes)]
+        sped = os.path.join(destino, f"sped_{sufixo}_{enc}.txt")
+        resumo = gerar_sped(sped, comp, notas_nfe(nfe, comp, **opcoes), notas_cte(cte, comp, **opcoes), enc, lixo, extras, semente)
+        lote["speds"].append(sped)
+        for tipo, notas in (("nfe", notas_nfe(nfe, comp, **opcoes)), ("cte", notas_cte(cte, comp, **opcoes))):
+            alvo = os.path.join(destino, f"xml_{tipo}_{sufixo}" + (".zip" if compactar else ""))
+            caminhos, n = gerar_xmls(alvo, notas, tipo, compactar, xml_invalidos, semente)
+            lote["xmls"][tipo] += caminhos; resumo[f"xml_{tipo}"] = n
+        for chave, v in resumo.items(): lote["esperado"][chave] = lote["esperado"].get(chave, 0) + v
+    return lote
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Gera SPEDs e XMLs sintéticos para os benchmarks.")
+    p.add_argument("destino")
+    p.add_argument("--competencias", type=int, default=3)
+    p.add_argument("--nfe", type=int, default=2000, help="NF-e por competência")
+    p.add_argument("--cte", type=int, default=500, help="CT-e por competência")
+    p.add_argument("--mb", type=float, default=None, help="tamanho aproximado de cada SPED em MB (substitui --nfe/--cte)")
+    p.add_argument("--casamento", type=float, default=0.9, help="fração de notas com XML")
+    p.add_argument("--divergencia", type=float, default=0.05, help="fração de notas com ICMS divergente no XML")
+    p.add_argument("--malformadas", type=float, default=0.001)
+    p.add_argument("--lixo", type=float, default=0.001)
+    p.add_argument("--xml-invalidos", type=float, default=0.0)
+    p.add_argument("--sem-zip", action="store_true", help="XMLs soltos em vez de um .zip por competência")
+    a = p.parse_args(argv)
+    nfe, cte = contagens_por_mb(a.mb, a.nfe, a.cte) if a.mb else (a.nfe, a.cte)
+    lote = gerar_lote(a.destino, a.competencias, nfe, cte, a.casamento, a.divergencia, a.malformadas, a.lixo,
+                      a.xml_invalidos, not a.sem_zip)
+    json.dump(lote, sys.stdout, indent=1, ensure_ascii=False); print()
+
+if __name__ == "__main__":
+    main()